@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Query index over the analysis log for SafeSpace.AI
+HR investigations ("all toxic messages from bob@company.com last month") need to
+find entries by user, label, method and time without reading the whole log.
+Every entry the log writes is also inserted into a SQLite table indexed on
+(user, timestamp), (label, timestamp) and (method, timestamp), updated from the
+same listener batches as the dashboard counters. When log compaction drops an
+entry superseded by a later one for the same message, it is removed from the
+index too, so investigations only see the latest result per message.
+
+Results are returned newest first and paginated with an opaque cursor holding
+the (timestamp, id) of the last entry returned, so each page is one index range
+scan however deep into the results it is:
+
+    python analysis_index.py --rebuild     # re-index the whole log (app stopped)
+"""
+
+import os
+import json
+import base64
+import sqlite3
+import argparse
+import threading
+
+import rollups
+from analysis_log import iter_log_entries, ANALYSIS_LOG_DIR
+
+ANALYSIS_INDEX_DB_PATH = os.environ.get('ANALYSIS_INDEX_DB_PATH', 'data/analysis_index.db')
+QUERY_PAGE_SIZE = 100
+QUERY_MAX_PAGE_SIZE = 1000
+# Entries inserted per transaction while rebuilding or catching up
+REBUILD_CHUNK = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    user TEXT,
+    label TEXT,
+    method TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_time ON analyses (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_user ON analyses (user, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_label ON analyses (label, timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_method ON analyses (method, timestamp, id);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Query parameters that filter on an indexed column
+FILTERS = ('user', 'label', 'method')
+SECONDARY_INDEXES = ('idx_analyses_time', 'idx_analyses_user', 'idx_analyses_label', 'idx_analyses_method')
+
+
+def normalize_bound(value):
+    """An ISO time bound in the stored form (naive local time)
+
+    Bounds with a UTC offset ("2026-09-30T00:00:00Z") are converted to local
+    time; local bounds are kept as given, so a prefix like "2026-09-30" still
+    stands for the whole period it names.
+    """
+    parsed = rollups.parse_time(value)
+    return value if parsed.isoformat().startswith(value) else parsed.isoformat()
+
+
+def encode_cursor(timestamp, entry_id):
+    return base64.urlsafe_b64encode(json.dumps([timestamp, entry_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) of the last entry on the previous page"""
+    try:
+        timestamp, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), int(entry_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class AnalysisIndex:
+    """SQLite index of analysis log entries for filtered, paginated queries"""
+
+    def __init__(self, path=ANALYSIS_INDEX_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            # Without statistics the planner may pick the label index for user + label queries
+            has_stats = conn.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() and \
+                conn.execute("SELECT 1 FROM sqlite_stat1 WHERE tbl = 'analyses'").fetchone()
+            if not has_stats:
+                conn.execute('ANALYZE')
+
+    def connection(self):
+        """Per-thread connection; WAL lets queries run while batches are indexed"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def last_id(self):
+        """Id of the last log entry in the index"""
+        row = self.connection().execute("SELECT value FROM state WHERE name = 'last_id'").fetchone()
+        return row['value'] if row else 0
+
+    def add(self, entries):
+        """Index a batch of log entries (the analysis log listener)"""
+        with self._write_lock:
+            last_id = self.last_id()
+            entries = [entry for entry in entries if entry.get('id', 0) > last_id]
+            if not entries:
+                return
+            with self.connection() as conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO analyses (id, timestamp, user, label, method, entry) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(entry['id'], entry.get('timestamp') or '', entry.get('user'), entry.get('label'),
+                      entry.get('method'), json.dumps(entry, ensure_ascii=False)) for entry in entries]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO state (name, value) VALUES ('last_id', ?)",
+                    (max(entry['id'] for entry in entries),)
+                )
+
+    def catch_up(self, log):
+        """Index entries of an AnalysisLog written while the index was not listening
+
+        Runs under the log's writer lock, like DashboardStats.catch_up, and only
+        reads the segments after the index's last id.
+        """
+        with log.locked():
+            last_id = self.last_id()
+            if last_id >= log.last_id():
+                return 0
+            return self._add_all(log.iter_entries(after_id=last_id))
+
+    def remove(self, entries):
+        """Delete entries log compaction dropped as superseded (the compaction listener)"""
+        with self._write_lock:
+            with self.connection() as conn:
+                conn.executemany('DELETE FROM analyses WHERE id = ?', [(entry['id'],) for entry in entries])
+
+    def rebuild(self, entries):
+        """Drop the index and rebuild it from the raw log entries"""
+        with self._write_lock:
+            with self.connection() as conn:
+                conn.execute('DELETE FROM analyses')
+                conn.execute('DELETE FROM state')
+                # Bulk inserts are much faster with the indexes built once at the end
+                for name in SECONDARY_INDEXES:
+                    conn.execute(f'DROP INDEX IF EXISTS {name}')
+        count = self._add_all(entries)
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute('ANALYZE')
+        return count
+
+    def _add_all(self, entries):
+        count = 0
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= REBUILD_CHUNK:
+                self.add(chunk)
+                count += len(chunk)
+                chunk = []
+        self.add(chunk)
+        return count + len(chunk)
+
+    def query(self, user=None, label=None, method=None, start=None, end=None,
+              limit=QUERY_PAGE_SIZE, cursor=None):
+        """Entries matching every given filter, newest first
+
+        start and end are ISO timestamps (end inclusive of anything it prefixes, so
+        end="2026-09-30" covers that whole day); ones with a UTC offset are
+        converted to the log's local time. Returns (entries, next_cursor),
+        with next_cursor None on the last page.
+        """
+        limit = max(1, min(int(limit), QUERY_MAX_PAGE_SIZE))
+        clauses = []
+        params = []
+        for column, value in zip(FILTERS, (user, label, method)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(normalize_bound(start))
+        if end:
+            # Timestamps that extend `end` ("2026-09-30T10:00" for "2026-09-30") are included
+            clauses.append('timestamp < ?')
+            params.append(normalize_bound(end) + '~')
+        if cursor:
+            clauses.append('(timestamp, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self.connection().execute(
+            f'SELECT id, timestamp, entry FROM analyses {where} ORDER BY timestamp DESC, id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['id'])
+        return [json.loads(row['entry']) for row in rows], next_cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain and query the analysis index")
+    parser.add_argument('--rebuild', action='store_true', help="Re-index the whole analysis log (stop the app first)")
+    parser.add_argument('--logs', default=ANALYSIS_LOG_DIR, help="Analysis log directory")
+    parser.add_argument('--db', default=ANALYSIS_INDEX_DB_PATH, help="Index database")
+    for name in FILTERS + ('start', 'end'):
+        parser.add_argument(f'--{name}', help=f"Only entries with this {name}")
+    parser.add_argument('--limit', type=int, default=20, help="Entries to print")
+    args = parser.parse_args()
+
+    index = AnalysisIndex(args.db)
+    if args.rebuild:
+        count = index.rebuild(iter_log_entries(args.logs))
+        print(f"✅ Indexed {count} log entries")
+        return
+
+    entries, _ = index.query(args.user, args.label, args.method, args.start, args.end, args.limit)
+    for entry in entries:
+        print(f"{entry.get('timestamp', '')[:19]}  {entry.get('label', ''):9} {entry.get('user', '')}: {entry.get('message', '')}")
+
+
+if __name__ == "__main__":
+    main()
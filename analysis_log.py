@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+"""
+Append-only analysis log for SafeSpace.AI
+Replaces the analysis_logs.json array, which had to be loaded and rewritten in
+full for every new entry. Entries are JSON Lines appended to segment files in
+data/analysis_log/ by a background writer thread:
+
+- append() only puts the entry on a bounded queue, so logging adds next to no
+  latency to a request
+- the writer drains everything queued, writes it with one write() and one
+  fsync(), so under load many entries share a single fsync
+- listeners registered with add_listener() receive each batch once it is on
+  disk, which is how derived views (counters, rollups, indexes) stay current
+
+The active segment is closed once it reaches ANALYSIS_LOG_SEGMENT_MB or
+ANALYSIS_LOG_SEGMENT_HOURS. Closed ("cold") segments are then compacted in the
+background - entries superseded by a later entry for the same message of the
+same analysis are dropped - and compressed with zstd (segment-000001.jsonl.zst),
+with a trained dictionary if one exists. Readers decompress them transparently,
+and whole cold segments older than ANALYSIS_LOG_RETENTION_DAYS are deleted:
+
+    python analysis_log.py --train-dictionary   # train a zstd dictionary on recent entries
+    python analysis_log.py --maintain           # compact and compress cold segments now
+
+Several processes may log to the same directory (gunicorn workers, the debug
+reloader): ids are allocated and segments rotated under an fcntl lock on
+writer.lock, and only one process compacts at a time. Readers may run anywhere.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking (Windows); only one process may write the log there
+    fcntl = None
+
+ANALYSIS_LOG_DIR = os.environ.get('ANALYSIS_LOG_DIR', 'data/analysis_log')
+ANALYSIS_LOG_QUEUE_SIZE = int(os.environ.get('ANALYSIS_LOG_QUEUE_SIZE', '10000'))
+# Most entries written (and fsynced) together
+ANALYSIS_LOG_BATCH_SIZE = 1000
+# How long append() waits for room in a full queue before the entry is dropped
+ANALYSIS_LOG_PUT_TIMEOUT = 1.0
+# The JSON array used before the log store, imported once into an empty log
+LEGACY_LOG_FILE = 'analysis_logs.json'
+# The active segment is closed once it is this large or this old
+ANALYSIS_LOG_SEGMENT_MB = float(os.environ.get('ANALYSIS_LOG_SEGMENT_MB', '64'))
+ANALYSIS_LOG_SEGMENT_HOURS = float(os.environ.get('ANALYSIS_LOG_SEGMENT_HOURS', '24'))
+# Cold segments last written longer ago than this are deleted (0 = keep forever)
+ANALYSIS_LOG_RETENTION_DAYS = float(os.environ.get('ANALYSIS_LOG_RETENTION_DAYS', '0'))
+ANALYSIS_LOG_ZSTD_LEVEL = int(os.environ.get('ANALYSIS_LOG_ZSTD_LEVEL', '9'))
+# Size of a trained zstd dictionary and how many recent entries it is trained on
+ZSTD_DICTIONARY_BYTES = 112 * 1024
+ZSTD_DICTIONARY_SAMPLES = 50000
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+COMPRESSED_SUFFIX = '.jsonl.zst'
+SEGMENT_PATTERN = re.compile(r'^segment-(\d+)\.jsonl(\.zst)?$')
+DICTIONARY_PATTERN = re.compile(r'^zstd-dictionary-(\d+)\.bin$')
+WRITER_LOCK_FILE = 'writer.lock'
+MAINTENANCE_LOCK_FILE = 'maintenance.lock'
+
+
+def segment_name(number, compressed=False):
+    return f'{SEGMENT_PREFIX}{number:06d}{COMPRESSED_SUFFIX if compressed else SEGMENT_SUFFIX}'
+
+
+def segment_number(path):
+    return int(SEGMENT_PATTERN.match(os.path.basename(path)).group(1))
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_SUFFIX)
+
+
+def dictionary_paths(directory):
+    """Trained zstd dictionary files of a log directory by dictionary id"""
+    return {
+        int(match.group(1)): os.path.join(directory, match.group(0))
+        for match in map(DICTIONARY_PATTERN.match, os.listdir(directory)) if match
+    }
+
+
+def load_dictionary(path):
+    import zstandard
+
+    with open(path, 'rb') as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+def open_compressed(path):
+    """Text stream over a .jsonl.zst segment, using the dictionary its frame was written with"""
+    import io
+    import zstandard
+
+    with open(path, 'rb') as f:
+        dict_id = zstandard.get_frame_parameters(f.read(18)).dict_id
+    dictionary = None
+    if dict_id:
+        dictionary_path = dictionary_paths(os.path.dirname(path)).get(dict_id)
+        if not dictionary_path:
+            raise ValueError(f"{path} was compressed with zstd dictionary {dict_id}, which is missing")
+        dictionary = load_dictionary(dictionary_path)
+    reader = zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(open(path, 'rb'), closefd=True)
+    return io.TextIOWrapper(reader, encoding='utf-8')
+
+
+def read_segment(path):
+    """Entries of one segment file, skipping a line left half-written by a crash"""
+    f = open_compressed(path) if is_compressed(path) else open(path, 'r', encoding='utf-8')
+    with f:
+        for line in f:
+            if not line.endswith('\n'):
+                return
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def list_segments(directory=ANALYSIS_LOG_DIR):
+    """Segment paths of a log directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    segments = {}
+    for name in os.listdir(directory):
+        match = SEGMENT_PATTERN.match(name)
+        # While a segment is being compressed both files exist; the .zst is only renamed into place complete
+        if match and (match.group(2) or int(match.group(1)) not in segments):
+            segments[int(match.group(1))] = os.path.join(directory, name)
+    return [segments[number] for number in sorted(segments)]
+
+
+def current_path(path):
+    """path, or its compressed replacement if the segment was compressed since it was listed"""
+    if is_compressed(path) or os.path.exists(path):
+        return path
+    return os.path.join(os.path.dirname(path), segment_name(segment_number(path), compressed=True))
+
+
+def first_id(path):
+    """Id of the first entry of a segment (None if it is empty)"""
+    entries = read_segment(path)
+    first = next(entries, None)
+    entries.close()
+    return first.get('id', 0) if first else None
+
+
+def iter_log_entries(directory=ANALYSIS_LOG_DIR, after_id=0):
+    """Entries of a log directory with ids above after_id, oldest first; safe to use while the app is writing"""
+    segments = list_segments(directory)
+    start = 0
+    if after_id:
+        # Ids ascend through the segments, so start at the newest one beginning at or before after_id
+        for index in range(len(segments) - 1, -1, -1):
+            first = first_id(current_path(segments[index]))
+            if first is not None and first <= after_id:
+                start = index
+                break
+    for path in segments[start:]:
+        for entry in read_segment(current_path(path)):
+            if entry.get('id', 0) > after_id:
+                yield entry
+
+
+def tail_id(path):
+    """Id of the last complete entry of a segment (0 if it has none)"""
+    if not is_compressed(path):
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+        # The first line of the tail may be cut off, the last may be half-written
+        lines = tail.split(b'\n')[1 if size > 65536 else 0:-1]
+        for line in reversed(lines):
+            try:
+                return json.loads(line)['id']
+            except (ValueError, KeyError, TypeError):
+                continue
+        if size <= 65536:
+            return 0
+    last_id = 0
+    for entry in read_segment(path):
+        last_id = entry.get('id', last_id)
+    return last_id
+
+
+def last_logged_id(directory=ANALYSIS_LOG_DIR):
+    """Id of the newest entry in a log directory (0 for an empty log)"""
+    # The active segment is empty just after a rotation, so look back to the newest entry
+    for path in reversed(list_segments(directory)):
+        last_id = tail_id(current_path(path))
+        if last_id:
+            return last_id
+    return 0
+
+
+def supersede_key(entry):
+    """Entries with the same key replace earlier ones (a message logged again for the same analysis)"""
+    if entry.get('analysis_id') and entry.get('message_id') is not None:
+        return entry['analysis_id'], entry['message_id']
+    return None
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Exclusive fcntl lock on path, shared by every process; yields False if blocking=False and it is taken"""
+    with open(path, 'a') as f:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class AnalysisLog:
+    """Append-only JSON Lines log of analyzed messages with a background writer"""
+
+    def __init__(self, directory=ANALYSIS_LOG_DIR, queue_size=ANALYSIS_LOG_QUEUE_SIZE,
+                 batch_size=ANALYSIS_LOG_BATCH_SIZE, segment_mb=ANALYSIS_LOG_SEGMENT_MB,
+                 segment_hours=ANALYSIS_LOG_SEGMENT_HOURS, retention_days=ANALYSIS_LOG_RETENTION_DAYS):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.batch_size = batch_size
+        self.segment_bytes = segment_mb * 1024 * 1024
+        self.segment_age = timedelta(hours=segment_hours)
+        self.retention_days = retention_days
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        self._maintenance_lock = threading.Lock()
+        self._maintenance_requested = threading.Event()
+        self._listeners = []
+        self._compaction_listeners = []
+        self._thread = None
+        self._file = None
+        self._segment_path = None
+        self._segment_started = None
+        # Id of the last entry written and size of the active segment after that write,
+        # so a batch only has to re-read the segment when another process wrote to it
+        self._last_id = 0
+        self._known_size = None
+
+    def segments(self):
+        """Segment paths, oldest first"""
+        return list_segments(self.directory)
+
+    def _active_segment(self):
+        """The segment new entries go to: the newest one, unless it has been compressed"""
+        segments = self.segments()
+        if not segments:
+            return os.path.join(self.directory, segment_name(1))
+        if is_compressed(segments[-1]):
+            return os.path.join(self.directory, segment_name(segment_number(segments[-1]) + 1))
+        return segments[-1]
+
+    @contextmanager
+    def locked(self):
+        """Hold the writer lock shared by every thread and process writing to this log
+
+        Ids are allocated, segments rotated and listeners called under it, so ids
+        stay unique and in file order however many processes (gunicorn workers,
+        the reloader) log to the same directory. The lock may be taken again by
+        the thread that holds it.
+        """
+        with self._lock:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1 and fcntl is not None:
+                    if self._lock_file is None:
+                        self._lock_file = open(os.path.join(self.directory, WRITER_LOCK_FILE), 'a')
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _recover(self):
+        """Cut a half-written last line off the active segment and re-read the last id
+
+        Only called under the writer lock, so a line without a newline is left
+        over from a crash rather than a write in progress.
+        """
+        with open(self._segment_path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+            if tail and not tail.endswith(b'\n'):
+                size = size - len(tail) + tail.rfind(b'\n') + 1
+                f.truncate(size)
+                print(f"⚠️ Dropped a partially written entry from {self._segment_path}")
+        self._last_id = last_logged_id(self.directory)
+        self._known_size = size
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analysis-log-writer', daemon=True)
+            self._thread.start()
+            # Segments closed before a restart may still be waiting to be compacted
+            self._start_maintenance()
+
+    def add_listener(self, callback):
+        """Call callback(entries) from the writer thread after each batch is on disk
+
+        Listeners run under the writer lock, so across processes they see batches
+        in id order.
+        """
+        self._listeners.append(callback)
+
+    def add_compaction_listener(self, callback):
+        """Call callback(entries) with the superseded entries compaction is about to drop
+
+        Derived views that hold a copy of each entry (the analysis index) remove
+        them here; it runs before the compacted segment replaces the original, so
+        a crash in between leaves them to be dropped again by the next compaction.
+        """
+        self._compaction_listeners.append(callback)
+
+    def append(self, entry):
+        """Queue an entry for writing; returns False if the queue stayed full and it was dropped
+
+        The entry gets its id when the writer writes it.
+        """
+        entry = dict(entry)
+        entry.setdefault('timestamp', datetime.now().isoformat())
+        try:
+            self._queue.put(entry, timeout=ANALYSIS_LOG_PUT_TIMEOUT)
+        except queue.Full:
+            self.dropped += 1
+            print(f"⚠️ Analysis log queue full - dropped entry ({self.dropped} dropped so far)")
+            return False
+        return True
+
+    def flush(self):
+        """Block until every queued entry has been written"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Everything that queued up during the last write shares this write and fsync
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"❌ Could not write {len(batch)} analysis log entries: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        self._segment_path = self._active_segment()
+        self._file = open(self._segment_path, 'a', encoding='utf-8')
+        self._known_size = None
+        self._segment_started = datetime.now()
+        # A segment carried over from before a restart is as old as its first entry
+        for entry in read_segment(self._segment_path):
+            try:
+                self._segment_started = datetime.fromisoformat(entry['timestamp'])
+            except (KeyError, TypeError, ValueError):
+                pass
+            break
+
+    def _sync_segment(self):
+        """Catch up with other processes' writes and rotations, then rotate if due"""
+        if self._file is None or self._segment_closed():
+            self._open_segment()
+        if os.fstat(self._file.fileno()).st_size != self._known_size:
+            self._recover()
+        if self._should_rotate():
+            self._rotate()
+
+    def _segment_closed(self):
+        """Whether another process has rotated past the open segment (it may even be compressed or deleted)"""
+        number = segment_number(self._segment_path) + 1
+        return os.fstat(self._file.fileno()).st_nlink == 0 or any(
+            os.path.exists(os.path.join(self.directory, segment_name(number, compressed)))
+            for compressed in (False, True)
+        )
+
+    def _should_rotate(self):
+        size = os.fstat(self._file.fileno()).st_size
+        return size > 0 and (
+            size >= self.segment_bytes or datetime.now() - self._segment_started >= self.segment_age
+        )
+
+    def _rotate(self):
+        """Close the active segment, start the next one and compact the closed one in the background"""
+        number = segment_number(self._segment_path) + 1
+        open(os.path.join(self.directory, segment_name(number)), 'a').close()
+        self._open_segment()
+        self._known_size = 0
+        print(f"🔄 Analysis log rotated to {os.path.basename(self._segment_path)}")
+        self._start_maintenance()
+
+    def _write(self, batch, keep_ids=False):
+        with self.locked():
+            self._sync_segment()
+            if not keep_ids:
+                batch = [{'id': self._last_id + number, **entry} for number, entry in enumerate(batch, 1)]
+            self._file.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_id = max([self._last_id] + [entry.get('id', 0) for entry in batch])
+            self._known_size = os.fstat(self._file.fileno()).st_size
+
+            for listener in self._listeners:
+                try:
+                    listener(batch)
+                except Exception as e:
+                    print(f"⚠️ Analysis log listener failed: {e}")
+
+    def _start_maintenance(self):
+        self._maintenance_requested.set()
+        threading.Thread(target=self.maintain, name='analysis-log-maintenance', daemon=True).start()
+
+    def maintain(self):
+        """Compact and compress every cold segment, then delete cold segments past retention"""
+        # A rotation while maintenance is running is picked up by another pass of the running one
+        if not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            # Only one process maintains the directory at a time
+            with file_lock(os.path.join(self.directory, MAINTENANCE_LOCK_FILE), blocking=False) as acquired:
+                while acquired:
+                    self._maintenance_requested.clear()
+                    self._maintain_once()
+                    if not self._maintenance_requested.is_set():
+                        break
+        except Exception as e:
+            print(f"⚠️ Analysis log maintenance failed: {e}")
+        finally:
+            self._maintenance_lock.release()
+
+    def _maintain_once(self):
+        # The newest segment is the active one, possibly of another process
+        cold = self.segments()[:-1]
+        removed = self._apply_retention(cold)
+        cold = [path for path in cold if os.path.exists(path)]
+        compacted = 0
+        dropped = 0
+        later_keys = set()
+        # Newest first, so an entry is only dropped for a later one that is kept
+        for path in reversed(cold):
+            if is_compressed(path):
+                later_keys = set()
+                continue
+            later_keys, count = self._compact_segment(path, later_keys)
+            compacted += 1
+            dropped += count
+        if compacted or removed:
+            print(f"🗜️ Analysis log maintenance: {compacted} segments compacted "
+                  f"({dropped} superseded entries dropped), {removed} expired segments deleted")
+
+    def _compact_segment(self, path, later_keys):
+        """Rewrite a cold segment without superseded entries, zstd-compressed if available
+
+        later_keys are the supersede keys of the next newer segment. Returns the
+        keys of the entries kept, for the next older segment, and how many were dropped.
+        """
+        kept = []
+        seen = set(later_keys)
+        entries = list(read_segment(path))
+        for entry in reversed(entries):
+            key = supersede_key(entry)
+            if key in seen:
+                continue
+            if key:
+                seen.add(key)
+            kept.append(entry)
+        kept.reverse()
+        keys = {key for key in map(supersede_key, kept) if key}
+        dropped = len(entries) - len(kept)
+        if dropped:
+            kept_ids = {id(entry) for entry in kept}
+            superseded = [entry for entry in entries if id(entry) not in kept_ids]
+            for listener in self._compaction_listeners:
+                try:
+                    listener(superseded)
+                except Exception as e:
+                    print(f"⚠️ Analysis log compaction listener failed: {e}")
+
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        if zstandard is None and not dropped:
+            return keys, dropped
+
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in kept).encode('utf-8')
+        target = path
+        if zstandard:
+            dictionaries = dictionary_paths(self.directory)
+            # The most recently trained dictionary matches the current shape of entries best
+            latest = max(dictionaries.values(), key=os.path.getmtime, default=None)
+            compressor = zstandard.ZstdCompressor(
+                level=ANALYSIS_LOG_ZSTD_LEVEL, dict_data=load_dictionary(latest) if latest else None
+            )
+            data = compressor.compress(data)
+            target = os.path.join(self.directory, segment_name(segment_number(path), compressed=True))
+
+        mtime = os.path.getmtime(path)
+        temporary = target + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # Retention goes by when the segment was last written, not when it was compacted
+        os.utime(temporary, (mtime, mtime))
+        os.replace(temporary, target)
+        if target != path:
+            os.remove(path)
+        return keys, dropped
+
+    def _apply_retention(self, cold):
+        """Delete cold segments last written longer ago than the retention period"""
+        if self.retention_days <= 0:
+            return 0
+        cutoff = time.time() - self.retention_days * 86400
+        removed = 0
+        for path in cold:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def train_dictionary(self, size=ZSTD_DICTIONARY_BYTES, samples=ZSTD_DICTIONARY_SAMPLES):
+        """Train a zstd dictionary on the most recent entries; segments compacted later use it"""
+        import zstandard
+
+        lines = []
+        # Only the newest segments are read
+        for path in reversed(self.segments()):
+            lines[:0] = [json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n' for entry in read_segment(path)]
+            if len(lines) >= samples:
+                break
+        dictionary = zstandard.train_dictionary(size, lines[-samples:])
+        path = os.path.join(self.directory, f'zstd-dictionary-{dictionary.dict_id()}.bin')
+        with open(path, 'wb') as f:
+            f.write(dictionary.as_bytes())
+        return path
+
+    def iter_entries(self, after_id=0):
+        """Entries with ids above after_id (every entry by default), oldest first"""
+        return iter_log_entries(self.directory, after_id)
+
+    def last_id(self):
+        """Id of the most recently written entry, by any process (0 for an empty log)"""
+        return last_logged_id(self.directory)
+
+    def is_empty(self):
+        return self.last_id() == 0
+
+    def import_legacy(self, path=LEGACY_LOG_FILE):
+        """Copy an old analysis_logs.json array into an empty log, keeping its ids"""
+        if not os.path.exists(path):
+            return 0
+        with self.locked():
+            # Checked under the lock so only one of several starting processes imports
+            if not self.is_empty():
+                return 0
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not import {path}: {e}")
+                return 0
+            if not entries:
+                return 0
+            entries.sort(key=lambda entry: entry.get('id', 0))
+            self._write(entries, keep_ids=True)
+        print(f"📥 Imported {len(entries)} entries from {path} into the analysis log")
+        return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the analysis log (stop the app first)")
+    parser.add_argument('--dir', default=ANALYSIS_LOG_DIR, help="Analysis log directory")
+    parser.add_argument('--train-dictionary', action='store_true',
+                        help="Train a zstd dictionary on recent entries for compressing cold segments")
+    parser.add_argument('--maintain', action='store_true', help="Compact and compress cold segments now")
+    parser.add_argument('--index', help="Analysis index database to remove superseded entries from "
+                                        "(default: ANALYSIS_INDEX_DB_PATH)")
+    args = parser.parse_args()
+
+    log = AnalysisLog(args.dir)
+    if args.train_dictionary:
+        print(f"✅ Trained {log.train_dictionary()}")
+    if args.maintain:
+        # Imported here: analysis_index imports this module
+        from analysis_index import AnalysisIndex, ANALYSIS_INDEX_DB_PATH
+        log.add_compaction_listener(AnalysisIndex(args.index or ANALYSIS_INDEX_DB_PATH).remove)
+        log.maintain()
+
+    total = 0
+    for path in log.segments():
+        size = os.path.getsize(path)
+        total += size
+        print(f"{os.path.basename(path):28} {size / 1024:10.1f} KB")
+    print(f"📊 {len(log.segments())} segments, {total / 1024 / 1024:.1f} MB, last id {log.last_id()}")
+
+
+if __name__ == "__main__":
+    main()
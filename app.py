@@ -1,4 +1,5 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, make_response, session, g
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, jsonify, make_response, session, g, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 from functools import wraps
 import os
 import csv
@@ -6,6 +7,23 @@ from io import StringIO
 from datetime import datetime
 import hashlib
 import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from itertools import chain, islice
+import tempfile
+
+from bulk_ingest import iter_upload_messages, parse_text_messages, message_key
+from job_queue import JobStore, JobWorkerPool
+from upstream_scheduler import UpstreamScheduler, INTERACTIVE, BULK, PRIORITY_WEIGHTS
+from conversation_context import annotate_context, decide_in_context
+from analysis_log import AnalysisLog
+from dashboard_stats import DashboardStats
+from analysis_index import AnalysisIndex
+from exports import (csv_row, iter_csv, gzip_chunks, summarize_results, iter_summary_report,
+                     iter_export, iter_cleaned_transcript, SUMMARY_OVERVIEW, SUMMARY_DETAIL_LIMIT, COLUMNAR_FORMATS)
+import rollups
 
 # Load environment variables
 try:
@@ -52,11 +70,60 @@ try:
 except Exception as e:
     print(f"⚠️ Could not load rewrite cache: {e}")
 
-# Store analysis results in session for export
-ANALYSIS_RESULTS = []
+# Append-only log of every analyzed message, written by a background thread
+ANALYSIS_LOG = AnalysisLog()
+ANALYSIS_LOG.import_legacy()
+
+# Admin dashboard counters, kept current from every batch the log writes
+DASHBOARD_STATS = DashboardStats()
+DASHBOARD_STATS.catch_up(ANALYSIS_LOG)
+ANALYSIS_LOG.add_listener(DASHBOARD_STATS.apply)
+
+# Indexed copy of the log for admin queries by user, label, method and time
+ANALYSIS_INDEX = AnalysisIndex()
+ANALYSIS_INDEX.catch_up(ANALYSIS_LOG)
+ANALYSIS_LOG.add_listener(ANALYSIS_INDEX.add)
+ANALYSIS_LOG.add_compaction_listener(ANALYSIS_INDEX.remove)
+ANALYSIS_LOG.start()
+
+# Concurrent upstream calls per bulk analysis
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', '8'))
+
+# Uploads with more messages than this run as background jobs instead of inside the request
+BULK_SYNC_LIMIT = int(os.environ.get('BULK_SYNC_LIMIT', '200'))
+JOB_PAGE_SIZE = 500
+# How often a results stream checks for newly saved results
+STREAM_POLL_SECONDS = 0.2
+# A results stream ends after this long, well inside gunicorn's 30s worker timeout,
+# and the browser's EventSource reconnects from the last result it received
+STREAM_MAX_SECONDS = int(os.environ.get('STREAM_MAX_SECONDS', '20'))
+
+# Display names for classification sources
+METHOD_NAMES = {
+    'groq': 'Groq API',
+    'student': 'Student Model',
+    'fallback': 'Fallback',
+    'default': 'Fallback'
+}
+
+# Largest accepted request body, including file uploads
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', '10'))
+# Uploads larger than this are spooled to a temporary file instead of memory
+UPLOAD_SPOOL_BYTES = 64 * 1024
+
+class SpooledUploadRequest(Request):
+    """Request that spools file uploads to disk once they outgrow a small memory buffer"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
+app.request_class = SpooledUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+@app.errorhandler(413)
+def upload_too_large(e=None):
+    return jsonify({'error': f'Upload too large - the limit is {MAX_UPLOAD_MB}MB'}), 413
 
 # Authentication helpers
 def login_required(f):
@@ -87,7 +154,10 @@ if GROQ_API_KEY:
 else:
     print("⚠️ No Groq API key - using rule-based detection only")
 
-def call_groq_api(text, task="toxicity"):
+# Every Groq call waits for a slot here, so realtime requests stay fast while bulk jobs run
+UPSTREAM_SCHEDULER = UpstreamScheduler()
+
+def call_groq_api(text, task="toxicity", priority=INTERACTIVE):
     """Call Groq API for ultra-fast toxicity detection or rewriting"""
     import requests
     
@@ -126,7 +196,8 @@ Be especially careful with:
                 "temperature": 0.1
             }
             
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            with UPSTREAM_SCHEDULER.slot(priority):
+                response = requests.post(url, headers=headers, json=data, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -171,7 +242,8 @@ Respond with only the rewritten message."""
                 "temperature": 0.3
             }
             
-            response = requests.post(url, headers=headers, json=data, timeout=10)
+            with UPSTREAM_SCHEDULER.slot(priority):
+                response = requests.post(url, headers=headers, json=data, timeout=10)
             
             if response.status_code == 200:
                 result = response.json()
@@ -190,12 +262,43 @@ Respond with only the rewritten message."""
     
     return None
 
-def classify_message_toxicity(text):
-    """Simple API-only classification using Groq"""
+# Local student model distilled from Groq verdicts (see distill_student.py)
+STUDENT_CONFIDENCE = float(os.environ.get('STUDENT_CONFIDENCE', '0.9'))
+try:
+    from student_model import load_student
+    STUDENT_MODEL = load_student()
+    if STUDENT_MODEL:
+        print(f"🎓 Student model {STUDENT_MODEL.metadata.get('version', '')} loaded - API used only for uncertain messages")
+except Exception as e:
+    print(f"⚠️ Could not load student model: {e}")
+    STUDENT_MODEL = None
+
+def classify_with_student(text):
+    """Classify with the local student model, or None when it is not confident enough"""
+    if not STUDENT_MODEL:
+        return None
+    
+    probability = STUDENT_MODEL.predict_proba(text)
+    if probability >= STUDENT_CONFIDENCE or probability <= 1 - STUDENT_CONFIDENCE or not GROQ_API_KEY:
+        is_toxic = probability >= 0.5
+        return {
+            'is_toxic': is_toxic,
+            'confidence': probability if is_toxic else 1 - probability,
+            'reason': "Local student model (distilled from Groq verdicts)",
+            'source': 'student'
+        }
+    return None
+
+def classify_message_toxicity(text, priority=INTERACTIVE):
+    """Cascade classification: local student model first, Groq API for uncertain messages"""
+    
+    student_result = classify_with_student(text)
+    if student_result:
+        return student_result
     
-    # Use Groq API for all classifications
+    # Use Groq API for all remaining classifications
     if GROQ_API_KEY:
-        api_result = call_groq_api(text, "toxicity")
+        api_result = call_groq_api(text, "toxicity", priority)
         if api_result:
             print(f"🟢 Groq API classified: {api_result['source']}")
             return api_result
@@ -224,7 +327,7 @@ def classify_message_toxicity(text):
         'source': 'default'
     }
 
-def generate_empathy_rewrite(text):
+def generate_empathy_rewrite(text, priority=INTERACTIVE):
     """Generate smart empathetic rewrite using Groq API"""
     
     # Enhanced check: include more workplace conversation indicators for rewriting
@@ -255,7 +358,7 @@ def generate_empathy_rewrite(text):
     
     # Try Groq API
     if GROQ_API_KEY:
-        rewrite = call_groq_api(text, "rewrite")
+        rewrite = call_groq_api(text, "rewrite", priority)
         if rewrite:
             if rewrite.strip() == "NO_REWRITE_NEEDED" or "NO_REWRITE_NEEDED" in rewrite:
                 print("🚫 No rewrite needed - message is purely derogatory")
@@ -269,153 +372,86 @@ def generate_empathy_rewrite(text):
 
 @app.route('/export-csv')
 def export_csv():
-    """Export analysis results as CSV"""
+    """Export analysis results as CSV, streamed row by row (?gzip=1 to compress)"""
+    job = JOB_STORE.get_job(session.get('analysis_id') or '')
+    if job:
+        rows = map(csv_row, JOB_STORE.iter_results(job['id']))
+    else:
+        # Fallback: No analysis performed yet
+        rows = [['N/A', 'No analysis performed yet', 'N/A', 'N/A', 'Please analyze some messages first',
+                 '', 'N/A', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]]
+    
+    chunks = iter_csv(rows)
+    filename = f'safespace_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    mimetype = 'text/csv'
+    if request.args.get('gzip') in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@app.route('/export-<any(parquet, arrow, ndjson):fmt>')
+def export_columnar(fmt):
+    """Export analysis results as Parquet, Arrow IPC or NDJSON for analytics tooling"""
+    job = JOB_STORE.get_job(session.get('analysis_id') or '')
+    if not job:
+        return jsonify({'error': 'No analysis performed yet'}), 404
+    
+    chunks = iter_export(JOB_STORE.iter_results(job['id']), fmt)
     try:
-        # Create CSV with real analysis data
-        from io import StringIO
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Message ID', 'Message Text', 'Classification', 'Confidence', 'Explanation', 'Empathy Rewrite', 'Method', 'Timestamp'])
-        
-        # Write real analysis results if available
-        if ANALYSIS_RESULTS:
-            for result in ANALYSIS_RESULTS:
-                writer.writerow([
-                    result.get('message_id', ''),
-                    result.get('message', ''),
-                    result.get('label', '').upper(),
-                    result.get('confidence', ''),
-                    result.get('explanation', ''),
-                    result.get('rewrite', ''),
-                    result.get('method', 'Groq API'),
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                ])
-        else:
-            # Fallback: No analysis performed yet
-            writer.writerow([
-                'N/A', 
-                'No analysis performed yet', 
-                'N/A', 
-                'N/A', 
-                'Please analyze some messages first', 
-                '', 
-                'N/A', 
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            ])
-        
-        # Create response
-        output.seek(0)
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename=safespace_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        return response
-        
-    except Exception as e:
-        print(f"❌ Error in CSV export: {e}")
-        return jsonify({'error': 'Export failed', 'details': str(e)}), 500
+        # Start the generator so a missing pyarrow is reported before the response begins
+        first = next(chunks)
+    except ImportError:
+        return jsonify({'error': f'{fmt} export needs pyarrow - pip install pyarrow'}), 501
+    except StopIteration:
+        first = b''
+    
+    extension, mimetype = COLUMNAR_FORMATS[fmt]
+    response = Response(stream_with_context(chain([first], chunks)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=safespace_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    return response
 
 @app.route('/export-summary')
 def export_summary():
-    """Export analysis summary as text file"""
-    try:
-        # Calculate real statistics from analysis results
-        if ANALYSIS_RESULTS:
-            total_messages = len(ANALYSIS_RESULTS)
-            toxic_messages = sum(1 for r in ANALYSIS_RESULTS if r.get('is_toxic', False))
-            safe_messages = total_messages - toxic_messages
-            toxicity_rate = (toxic_messages / total_messages * 100) if total_messages > 0 else 0
-            rewrites_count = sum(1 for r in ANALYSIS_RESULTS if r.get('rewrite', ''))
-        else:
-            total_messages = 0
-            toxic_messages = 0
-            safe_messages = 0
-            toxicity_rate = 0
-            rewrites_count = 0
-        
-        summary_text = f"""SafeSpace.AI Analysis Summary
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-OVERVIEW:
-- Total Messages Analyzed: {total_messages}
-- Toxic Messages: {toxic_messages}
-- Safe Messages: {safe_messages}
-- Toxicity Rate: {toxicity_rate:.1f}%
-- Empathetic Rewrites: {rewrites_count}
-
-METHODOLOGY:
-- Detection Engine: Groq API (llama-3.1-8b-instant)
-- Response Time: ~0.2 seconds
-- Confidence Threshold: 0.5
-- API Source: Ultra-fast LLM analysis
-
-ANALYSIS DETAILS:"""
-
-        if ANALYSIS_RESULTS:
-            for i, result in enumerate(ANALYSIS_RESULTS, 1):
-                summary_text += f"""
-{i}. Message: "{result.get('message', 'N/A')[:100]}{'...' if len(result.get('message', '')) > 100 else ''}"
-   Classification: {result.get('label', 'N/A').upper()}
-   Confidence: {result.get('confidence', 'N/A')}
-   Explanation: {result.get('explanation', 'N/A')}
-   Rewrite: {result.get('rewrite', 'None') if result.get('rewrite') else 'None'}
-"""
-        else:
-            summary_text += "\nNo analysis performed yet. Please analyze some messages first."
-
-        summary_text += f"""
-
-RECOMMENDATIONS:
-- Continue monitoring workplace communications
-- Review flagged content for policy violations  
-- Implement empathetic communication training
-- Use AI-generated rewrites for constructive feedback
+    """Export analysis summary as a streamed text (or ?format=markdown) report
 
-Generated by SafeSpace.AI - Workplace Harassment Detection System
-"""
-        
-        response = make_response(summary_text)
-        response.headers['Content-Type'] = 'text/plain'
-        response.headers['Content-Disposition'] = f'attachment; filename=safespace_summary_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-        return response
-        
-    except Exception as e:
-        print(f"❌ Error in summary export: {e}")
-        return jsonify({'error': 'Export failed', 'details': str(e)}), 500
+    ?detail=N lists the first N messages (default SUMMARY_DETAIL_LIMIT, "all" for every one).
+    """
+    fmt = request.args.get('format', 'text')
+    if fmt not in SUMMARY_OVERVIEW:
+        return jsonify({'error': 'format must be "text" or "markdown"'}), 400
+    detail = request.args.get('detail', str(SUMMARY_DETAIL_LIMIT))
+    if detail != 'all' and not detail.isdigit():
+        return jsonify({'error': 'detail must be a number or "all"'}), 400
+    
+    # Totals come from the job's counters, which were kept up to date as results were saved
+    job = JOB_STORE.get_job(session.get('analysis_id') or '')
+    summary = job_summary(job) if job else summarize_results([])
+    results = JOB_STORE.iter_results(job['id']) if job else []
+    
+    chunks = iter_summary_report(summary, results, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                 None if detail == 'all' else int(detail), fmt)
+    extension = 'md' if fmt == 'markdown' else 'txt'
+    response = Response(stream_with_context(chunks), mimetype='text/markdown' if fmt == 'markdown' else 'text/plain')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=safespace_summary_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    return response
 
 @app.route('/export-cleaned-text')
 def export_cleaned_text():
-    """Export cleaned/rewritten text"""
-    try:
-        cleaned_text = f"""SafeSpace.AI - Cleaned Messages Export
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-EMPATHETICALLY REWRITTEN MESSAGES:
-
-1. Original: "You are such an idiot for thinking that"
-   Rewritten: "I have concerns about that approach"
-
-2. Original: "This is stupid and won't work"  
-   Rewritten: "I have reservations about this strategy"
-
-3. Original: "You're being ridiculous"
-   Rewritten: "I think we might have different perspectives"
-
-These messages have been processed through our AI-powered empathy rewriter 
-to promote positive workplace communication.
-
-Generated by SafeSpace.AI
-"""
-        
-        response = make_response(cleaned_text)
-        response.headers['Content-Type'] = 'text/plain'
-        response.headers['Content-Disposition'] = f'attachment; filename=safespace_cleaned_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-        return response
-        
-    except Exception as e:
-        print(f"❌ Error in cleaned text export: {e}")
-        return jsonify({'error': 'Export failed', 'details': str(e)}), 500
+    """Export the cleaned conversation built from the session's stored results, streamed"""
+    job = JOB_STORE.get_job(session.get('analysis_id') or '')
+    results = JOB_STORE.iter_results(job['id']) if job else []
+    
+    chunks = iter_cleaned_transcript(results, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    response = Response(stream_with_context(chunks), mimetype='text/plain')
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename=safespace_cleaned_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
+    return response
 
 def save_rewrite_cache():
     """Save rewrite cache to file"""
@@ -456,163 +492,318 @@ def logout():
 @admin_required
 def admin_dashboard():
     """Admin analytics dashboard"""
-    # Generate sample analytics data
-    from datetime import datetime, timedelta
-    import random
-    
-    # Sample data for charts
-    daily_stats = []
-    for i in range(7):
-        date = datetime.now() - timedelta(days=6-i)
-        daily_stats.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'total_messages': random.randint(50, 200),
-            'toxic_messages': random.randint(5, 40),
-            'safe_messages': random.randint(45, 160)
-        })
-    
-    analytics_data = {
-        'total_users': 156,
-        'total_messages_analyzed': 2847,
-        'toxic_messages_detected': 342,
-        'safe_messages': 2505,
-        'toxicity_rate': 12.0,
-        'daily_stats': daily_stats,
-        'top_toxic_patterns': [
-            {'pattern': 'Personal Attacks', 'count': 89},
-            {'pattern': 'Profanity', 'count': 67},
-            {'pattern': 'Threats', 'count': 45},
-            {'pattern': 'Discriminatory Language', 'count': 32},
-            {'pattern': 'Cyberbullying', 'count': 28}
-        ]
-    }
-    
-    return render_template('admin_dashboard.html', data=analytics_data)
+    return render_template(
+        'admin_dashboard.html',
+        analytics=DASHBOARD_STATS.snapshot(),
+        user={'email': session['user_id'], 'role': session.get('user_role', 'admin')},
+        system_stats={
+            'cached_explanations': len(EXPLANATION_CACHE),
+            'cached_rewrites': len(REWRITE_CACHE),
+            # The counters' persisted last id; the log's own would read segments on every render
+            'log_entries': DASHBOARD_STATS.last_id()
+        }
+    )
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def contextual_rewrite(message, action, reason, priority=INTERACTIVE):
+    """Apply a conversation-context decision: drop the message, or rewrite it with Groq"""
+    if action == 'remove':
+        return {'type': 'remove', 'rewrite': None, 'reason': reason}
+    
+    rewrite = call_groq_api(message, "rewrite", priority) if GROQ_API_KEY else None
+    return {'type': 'rewrite', 'rewrite': rewrite, 'reason': reason if rewrite else f"{reason} (no rewrite available)"}
+
+def analyze_message_context(message, messages, index):
+    """Decide "remove" or "rewrite" for a toxic message from its neighbours in the transcript"""
+    return decide_in_context(messages, index)[0]
+
+def generate_contextual_empathy_rewrite(message, messages, index, priority=INTERACTIVE):
+    """Remove-or-rewrite decision for messages[index] plus the rewrite when it is kept"""
+    action, reason = decide_in_context(messages, index)
+    return contextual_rewrite(message, action, reason, priority)
+
+def classify_message_toxicity_with_explanation(message, priority=INTERACTIVE):
+    """Classification in the label/score/explanation shape used by the debug scripts"""
+    result = classify_message_toxicity(message, priority)
+    return {
+        'label': 'toxic' if result['is_toxic'] else 'safe',
+        'is_toxic': result['is_toxic'],
+        'score': result['confidence'],
+        'confidence': result['confidence'],
+        'method': METHOD_NAMES.get(result['source'], result['source']),
+        'explanation': result['reason'],
+        'source': result['source']
+    }
+
+def analyze_single_message(message, message_id=1, user=None, timestamp=None, priority=INTERACTIVE,
+                           context_action=None, context_reason=None):
+    """Classify one message and generate an empathetic rewrite if it is toxic
+    
+    Messages from a transcript carry a conversation-context decision; toxic ones
+    are then either marked for removal or rewritten with that decision's reason.
+    """
+    result = classify_message_toxicity(message, priority)
+    
+    rewrite = None
+    rewrite_type = ''
+    rewrite_reason = ''
+    if result['is_toxic'] and context_action:
+        contextual = contextual_rewrite(message, context_action, context_reason, priority)
+        rewrite = contextual['rewrite']
+        rewrite_type = contextual['type']
+        rewrite_reason = contextual['reason']
+    elif result['is_toxic']:
+        rewrite = generate_empathy_rewrite(message, priority)
+        rewrite_type = 'rewrite' if rewrite else ''
+        rewrite_reason = 'AI-generated empathetic alternative' if rewrite else ''
+    
+    if rewrite_type == 'remove':
+        recommended_action = 'Remove Message'
+    elif result['is_toxic']:
+        recommended_action = 'Review and Address'
+    else:
+        recommended_action = 'No Action Needed'
+    
+    return {
+        'message_id': message_id,
+        'message': message,
+        'user': user,
+        'timestamp': timestamp,
+        'is_toxic': result['is_toxic'],
+        'label': 'toxic' if result['is_toxic'] else 'safe',
+        'confidence': result['confidence'],
+        'score': result['confidence'],  # Template expects 'score'
+        'explanation': result['reason'],
+        'source': result['source'],
+        'rewrite': rewrite or '',
+        'empathy_rewrite': rewrite or '',
+        'method': METHOD_NAMES.get(result['source'], result['source']),
+        'recommended_action': recommended_action,
+        'rewrite_reason': rewrite_reason,
+        'rewrite_type': rewrite_type,
+        'analyzed_at': datetime.now().isoformat()
+    }
+
+def log_analysis(result, user=None, analysis_id=None):
+    """Append an analyzed message to the analysis log; returns without waiting for the disk"""
+    message = result['message']
+    ANALYSIS_LOG.append({
+        'timestamp': result.get('analyzed_at') or datetime.now().isoformat(),
+        'user': result.get('user') or user or 'anonymous',
+        'message': message[:200] + '...' if len(message) > 200 else message,
+        'message_length': len(message),
+        'label': result['label'],
+        'score': result['confidence'],
+        'method': result.get('method', 'unknown'),
+        'is_multiline': '\n' in message,
+        'toxic_lines': 1 if result['is_toxic'] else 0,
+        'rewritten_lines': 1 if result['is_toxic'] and result.get('rewrite') else 0,
+        'removed_lines': 1 if result.get('rewrite_type') == 'remove' else 0,
+        'analysis_id': analysis_id,
+        # Identifies the message within its analysis, so a re-logged result supersedes the earlier one
+        'message_id': result.get('message_id')
+    })
+
+def log_job_results(job_id, results):
+    """Log a batch of background job results as they are saved"""
+    for result in results:
+        log_analysis(result, analysis_id=job_id)
+
+def fan_out_result(result, entry):
+    """Copy the result of a repeated message to one of its positions
+    
+    The position keeps its own id, user and timestamp and its own context
+    decision. Returns None when the result was analyzed for removal but this
+    position needs a rewrite, so the message has to be analyzed again.
+    """
+    result = {**result, 'message_id': entry['message_id'], 'message': entry['message'],
+              'user': entry.get('user'), 'timestamp': entry.get('timestamp')}
+    action = entry.get('context_action')
+    if not result['is_toxic'] or not action:
+        return result
+    if action == 'remove':
+        return {**result, 'rewrite': '', 'empathy_rewrite': '', 'rewrite_type': 'remove',
+                'rewrite_reason': entry.get('context_reason'), 'recommended_action': 'Remove Message'}
+    if result['rewrite_type'] == 'remove':
+        return None
+    return {**result, 'rewrite_type': 'rewrite', 'recommended_action': 'Review and Address',
+            'rewrite_reason': entry.get('context_reason') if result['rewrite'] else result['rewrite_reason']}
+
+def analyze_messages(entries):
+    """Analyze parsed messages concurrently, keeping their original order
+    
+    One streaming pass over the transcript attaches each message's remove-or-
+    rewrite context decision. Repeated messages are then analyzed once and the
+    result is copied to every position with that position's own id, user,
+    timestamp and context decision.
+    """
+    entries = [{**entry, 'message_id': message_id}
+               for message_id, entry in enumerate(annotate_context(entries), 1)]
+    
+    groups = {}
+    for entry in entries:
+        groups.setdefault(message_key(entry['message']), []).append(entry)
+    
+    def analyze_group(group):
+        # Analyze a repeat that needs a rewrite if there is one, so every repeat can use it
+        entry = next((e for e in group if e['context_action'] == 'rewrite'), group[0])
+        return analyze_single_message(entry['message'], user=entry.get('user'), timestamp=entry.get('timestamp'),
+                                      priority=BULK, context_action=entry['context_action'],
+                                      context_reason=entry['context_reason'])
+    
+    # Each message is an independent, I/O-bound API call, so threads overlap the network waits
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+        results = dict(zip(groups, executor.map(analyze_group, groups.values())))
+    
+    if len(groups) < len(entries):
+        print(f"🔁 Analyzed {len(groups)} unique messages for {len(entries)} entries")
+    
+    return [fan_out_result(results[message_key(entry['message'])], entry) for entry in entries]
+
+def build_summary(results):
+    """Summary counts for the results template"""
+    return {**summarize_results(results), 'analysis_timestamp': datetime.now().isoformat()}
+
+def realtime_response(result):
+    """JSON payload for the real-time typing box"""
+    response = {
+        'is_toxic': result['is_toxic'],
+        'confidence': result['confidence'],
+        'score': result['confidence'],  # Frontend expects 'score'
+        'explanation': result['explanation'],
+        'source': result['source'],
+        'status': result['label'],  # Frontend compatibility
+        'label': result['label']   # Frontend expects 'label'
+    }
+    if result['rewrite']:
+        response['rewrite'] = result['rewrite']  # Frontend expects 'rewrite'
+        response['empathy_rewrite'] = result['rewrite']  # Keep for backward compatibility
+        response['suggestion'] = result['rewrite']  # Keep for backward compatibility
+    return response
+
+def get_request_messages():
+    """Lazily extract messages from an upload, the bulk textarea or a single-message body"""
+    # Check for file upload first
+    if 'file_upload' in request.files:
+        uploaded_file = request.files['file_upload']
+        if uploaded_file and uploaded_file.filename:
+            print(f"🔍 File uploaded: {uploaded_file.filename}")
+            # Parsed straight from the spooled upload, one message at a time
+            messages = iter_upload_messages(uploaded_file.stream, uploaded_file.filename)
+            first = next(messages, None)
+            if first:
+                return chain([first], messages)
+    
+    # If no file or file is empty, try JSON or form data
+    data = request.get_json(silent=True) or request.form.to_dict()
+    if not data:
+        return iter(())
+    
+    # The bulk textarea holds one message per line
+    if data.get('text_input'):
+        return iter(parse_text_messages(data['text_input']))
+    
+    message = (data.get('message') or data.get('text') or '').strip()
+    return iter([{'message': message, 'user': None, 'timestamp': None}] if message else [])
+
+def process_job_message(entry, priority=BULK):
+    """Analyze one stored job message (runs on a background job worker)"""
+    return analyze_single_message(entry['message'], entry['message_id'], entry.get('user'), entry.get('timestamp'),
+                                  priority, entry.get('context_action'), entry.get('context_reason'))
+
+def session_owner():
+    """Opaque token for this browser session, recorded as the owner of the jobs it submits"""
+    if 'job_owner' not in session:
+        session['job_owner'] = uuid.uuid4().hex
+    return session['job_owner']
+
+def get_owned_job(job_id):
+    """The job if this session submitted it, else None so other sessions' jobs look unknown"""
+    job = JOB_STORE.get_job(job_id)
+    if not job or job['owner'] is None or job['owner'] != session.get('job_owner'):
+        return None
+    return job
+
+def submit_analysis_job(messages, priority=BULK):
+    """Queue messages as a background analysis job and wake the workers
+
+    Workers start on the first committed chunk while the rest of the upload is
+    still being parsed into the job.
+    """
+    filename = request.files['file_upload'].filename if 'file_upload' in request.files else None
+    job_id = JOB_STORE.create_job(filename, priority, session_owner())
+    JOB_WORKER_POOL.notify()
+    try:
+        # Context decisions are made in the same streaming pass that stores the messages
+        count = JOB_STORE.add_messages(job_id, annotate_context(messages))
+        print(f"📥 Queued analysis job {job_id} with {count} messages")
+    except (UnicodeDecodeError, csv.Error) as e:
+        print(f"❌ Could not read upload for job {job_id}: {e}")
+        JOB_STORE.finish_job(job_id, 'failed', f'Could not read file: {str(e)}')
+    finally:
+        JOB_STORE.finish_ingest(job_id)
+    return job_id
+
+def job_summary(job):
+    """Summary counts for the results template, taken from the job's counters"""
+    processed = job['processed']
+    return {
+        'total_messages': processed,
+        'toxic_messages': job['toxic_count'],
+        'safe_messages': processed - job['toxic_count'],
+        'toxicity_rate': round((job['toxic_count'] / processed) * 100, 1) if processed > 0 else 0,
+        'total_cleaned': job['rewrites_count'] + job['removed_count'],
+        'removed_count': job['removed_count'],
+        'rewrites_count': job['rewrites_count'],
+        'analysis_timestamp': job['finished_at'] or job['created_at']
+    }
+
+# Background job workers for large bulk analyses
+JOB_STORE = JobStore()
+JOB_WORKER_POOL = JobWorkerPool(JOB_STORE, process_job_message, message_key=message_key, fan_out=fan_out_result,
+                                on_results=log_job_results, message_workers=BULK_WORKERS)
+JOB_WORKER_POOL.start()
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     try:
         # Debug: Print request info
         print(f"🔍 Request method: {request.method}")
         print(f"🔍 Content type: {request.content_type}")
-        print(f"🔍 Raw data: {request.get_data()}")
-        
-        # Try different ways to get the data
-        data = None
-        message = None
-        
-        # Check for file upload first
-        if 'file_upload' in request.files:
-            uploaded_file = request.files['file_upload']
-            if uploaded_file and uploaded_file.filename:
-                print(f"🔍 File uploaded: {uploaded_file.filename}")
-                try:
-                    # Read file content
-                    file_content = uploaded_file.read().decode('utf-8')
-                    message = file_content.strip()
-                    print(f"🔍 File content length: {len(message)} characters")
-                except Exception as e:
-                    return jsonify({'error': f'Could not read file: {str(e)}'}), 400
-        
-        # If no file or file is empty, try form data
-        if not message:
-            if request.content_type == 'application/json':
-                data = request.get_json()
-            else:
-                # Try form data
-                data = request.form.to_dict()
-                if not data:
-                    # Try raw JSON parsing
-                    try:
-                        import json
-                        data = json.loads(request.get_data().decode('utf-8'))
-                    except:
-                        pass
-            
-            print(f"🔍 Parsed data: {data}")
-            
-            # Check for message in multiple field names
-            if data:
-                message = data.get('message') or data.get('text') or data.get('text_input')
-        
-        if not message:
-            return jsonify({'error': 'No message provided', 'debug': f'data={data}'}), 400
-        
-        message = message.strip()
-        if not message:
-            return jsonify({'error': 'Empty message'}), 400
-        
-        print(f"🔍 Analyzing: '{message}'")
-        
-        # Classify the message
-        result = classify_message_toxicity(message)
         
-        # Prepare response
-        response = {
-            'is_toxic': result['is_toxic'],
-            'confidence': result['confidence'],
-            'score': result['confidence'],  # Frontend expects 'score'
-            'explanation': result['reason'],
-            'source': result['source'],
-            'status': 'toxic' if result['is_toxic'] else 'safe',  # Frontend compatibility
-            'label': 'toxic' if result['is_toxic'] else 'safe'   # Frontend expects 'label'
-        }
-        
-        # Generate rewrite if toxic
-        if result['is_toxic']:
-            rewrite = generate_empathy_rewrite(message)
-            if rewrite:  # Only include rewrite if it's not None
-                response['rewrite'] = rewrite  # Frontend expects 'rewrite'
-                response['empathy_rewrite'] = rewrite  # Keep for backward compatibility
-                response['suggestion'] = rewrite  # Keep for backward compatibility
+        try:
+            messages = get_request_messages()
+            # Only look ahead far enough to decide between inline and background analysis
+            head = list(islice(messages, BULK_SYNC_LIMIT + 1))
+        except (UnicodeDecodeError, csv.Error) as e:
+            return jsonify({'error': f'Could not read file: {str(e)}'}), 400
+        except RequestEntityTooLarge:
+            return upload_too_large()
         
-        print(f"📊 Result: {'TOXIC' if result['is_toxic'] else 'SAFE'} ({result['confidence']:.1%}) via {result['source']}")
+        if not head:
+            return jsonify({'error': 'No message provided'}), 400
         
-        # Debug: Print the exact response being sent
-        print(f"🔍 Response being sent: {response}")
+        # Large uploads would outlive the worker timeout, so hand them to the job queue
+        if len(head) > BULK_SYNC_LIMIT:
+            job_id = submit_analysis_job(chain(head, messages))
+            return redirect(url_for('view_job', job_id=job_id))
+        messages = head
         
-        # For bulk analysis, render HTML template instead of returning JSON
-        analysis_results = [{
-            'message_id': 1,
-            'message': message,
-            'is_toxic': result['is_toxic'],
-            'label': 'toxic' if result['is_toxic'] else 'safe',
-            'confidence': result['confidence'],
-            'score': result['confidence'],  # Template expects 'score'
-            'explanation': result['reason'],
-            'source': result['source'],
-            'rewrite': response.get('rewrite', ''),
-            'empathy_rewrite': response.get('rewrite', ''),
-            'method': 'Groq API',
-            'recommended_action': 'Review and Address' if result['is_toxic'] else 'No Action Needed',
-            'rewrite_reason': 'AI-generated empathetic alternative' if response.get('rewrite') else '',
-            'rewrite_type': 'rewrite' if response.get('rewrite') else ''
-        }]
+        print(f"🔍 Analyzing {len(messages)} messages with {BULK_WORKERS} workers")
         
-        # Store results globally for export functionality
-        global ANALYSIS_RESULTS
-        ANALYSIS_RESULTS = analysis_results.copy()
+        analysis_results = analyze_messages(messages)
+        summary = build_summary(analysis_results)
         
-        # Create summary object that the template expects
-        from datetime import datetime
-        toxic_count = 1 if result['is_toxic'] else 0
-        safe_count = 0 if result['is_toxic'] else 1
-        total_count = 1
+        print(f"📊 Result: {summary['toxic_messages']} toxic / {summary['total_messages']} messages")
         
-        summary = {
-            'total_messages': total_count,
-            'toxic_messages': toxic_count,
-            'safe_messages': safe_count,
-            'toxicity_rate': round((toxic_count / total_count) * 100, 1) if total_count > 0 else 0,
-            'total_cleaned': 1 if result['is_toxic'] and response.get('rewrite') else 0,
-            'removed_count': 0,
-            'rewrites_count': 1 if result['is_toxic'] and response.get('rewrite') else 0,
-            'analysis_timestamp': datetime.now().isoformat()
-        }
+        # Exports read the session's latest analysis from the shared job store
+        analysis_id = JOB_STORE.save_analysis(analysis_results, owner=session_owner())
+        session['analysis_id'] = analysis_id
+        for result in analysis_results:
+            log_analysis(result, session.get('user_id'), analysis_id)
         
         return render_template('results.html', 
                              results=analysis_results,
@@ -626,8 +817,207 @@ def analyze():
 
 @app.route('/api/analyze-realtime', methods=['POST'])
 def analyze_realtime():
-    """Real-time analysis endpoint for frontend compatibility"""
-    return analyze()
+    """Real-time single-message analysis for the typing box"""
+    try:
+        data = request.get_json(silent=True) or request.form.to_dict()
+        message = (data.get('message') or data.get('text') or data.get('text_input') or '').strip()
+        if not message:
+            return jsonify({'error': 'Empty message'}), 400
+        
+        result = analyze_single_message(message)
+        log_analysis(result, session.get('user_id'))
+        print(f"📊 Result: {result['label'].upper()} ({result['confidence']:.1%}) via {result['source']}")
+        return jsonify(realtime_response(result))
+        
+    except Exception as e:
+        print(f"❌ Error in realtime analysis: {e}")
+        return jsonify({'error': 'Analysis failed', 'details': str(e)}), 500
+
+@app.route('/api/upstream-stats')
+@admin_required
+def upstream_stats():
+    """Queue depth and recent queue-wait percentiles of each upstream priority class"""
+    return jsonify(UPSTREAM_SCHEDULER.stats())
+
+@app.route('/api/admin/timeseries')
+@admin_required
+def admin_timeseries():
+    """Analysis counts per minute, hour or day between ?start= and ?end= (ISO timestamps)"""
+    try:
+        end = rollups.parse_time(request.args['end']) if request.args.get('end') else datetime.now()
+        start = rollups.parse_time(request.args['start']) if request.args.get('start') else None
+        resolution = request.args.get('resolution', 'auto')
+        if resolution == 'auto':
+            resolution = rollups.auto_resolution(start, end) if start else rollups.HOUR
+        if resolution not in rollups.KEY_LENGTHS:
+            return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+        series = DASHBOARD_STATS.timeseries(resolution, start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'resolution': resolution, 'buckets': series})
+
+@app.route('/api/admin/analyses')
+@admin_required
+def admin_analyses():
+    """Logged analyses filtered by ?user=, ?label=, ?method=, ?start= and ?end=, newest first
+
+    Pass the returned next_cursor as ?cursor= to get the following page.
+    """
+    try:
+        entries, next_cursor = ANALYSIS_INDEX.query(
+            user=request.args.get('user'),
+            label=request.args.get('label'),
+            method=request.args.get('method'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            limit=request.args.get('limit', 100),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'entries': entries, 'next_cursor': next_cursor})
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Submit a bulk analysis as a background job"""
+    # Re-analysis of old data can ask for "backfill" so it yields to uploads waiting on results
+    priority = request.args.get('priority') or request.form.get('priority') or BULK
+    if priority == INTERACTIVE or priority not in PRIORITY_WEIGHTS:
+        return jsonify({'error': 'priority must be "bulk" or "backfill"'}), 400
+    
+    try:
+        messages = get_request_messages()
+        first = next(messages, None)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': f'Could not read file: {str(e)}'}), 400
+    
+    if not first:
+        return jsonify({'error': 'No message provided'}), 400
+    
+    job_id = submit_analysis_job(chain([first], messages), priority)
+    job = get_owned_job(job_id)
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'total': job['total'],
+        'priority': job['priority'],
+        'status_url': url_for('job_status', job_id=job_id),
+        'results_url': url_for('job_results', job_id=job_id),
+        'view_url': url_for('view_job', job_id=job_id)
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a background analysis job"""
+    job = get_owned_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    job.pop('owner')
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """One page of a job's per-message results"""
+    job = get_owned_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(1000, max(1, request.args.get('per_page', 100, type=int)))
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'page': page,
+        'per_page': per_page,
+        'total': job['processed'],
+        'results': JOB_STORE.get_results(job_id, page, per_page)
+    })
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Event"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/jobs/<job_id>/stream')
+def stream_job(job_id):
+    """Server-Sent Events stream of a job's results as they are saved, with running counters"""
+    job = get_owned_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # Reconnecting browsers resume from the last event they received
+    after = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', 0, type=int)
+    
+    def generate():
+        # Reconnect a second after the stream is ended below
+        yield 'retry: 1000\n\n'
+        started = time.monotonic()
+        cursor = after
+        # The results page renders JOB_PAGE_SIZE rows; past that only progress is streamed
+        rows = JOB_STORE.count_results_until(job_id, after, JOB_PAGE_SIZE) if after else 0
+        processed = None
+        idle_polls = 0
+        while True:
+            current = JOB_STORE.get_job(job_id)
+            batch = []
+            if rows < JOB_PAGE_SIZE:
+                batch = JOB_STORE.get_results_since(job_id, cursor, JOB_PAGE_SIZE - rows)
+                rows += len(batch)
+            for cursor, result in batch:
+                yield sse_event('result', result, cursor)
+            
+            changed = current['processed'] != processed
+            processed = current['processed']
+            if batch or changed or idle_polls % 50 == 0:
+                yield sse_event('progress', {
+                    'status': current['status'],
+                    'processed': current['processed'],
+                    'total': current['total'],
+                    'progress': current['progress'],
+                    'summary': job_summary(current)
+                })
+            
+            # The job row is read before the results, so nothing saved before it finished is missed
+            if not batch and current['status'] in ('completed', 'failed'):
+                yield sse_event('done', {'status': current['status'], 'error': current['error']})
+                return
+            if time.monotonic() - started >= STREAM_MAX_SECONDS:
+                return
+            
+            idle_polls = 0 if batch or changed else idle_polls + 1
+            if not batch:
+                time.sleep(STREAM_POLL_SECONDS)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+@app.route('/jobs/<job_id>/view')
+def view_job(job_id):
+    """Results page for a background job, refreshed while it is still running"""
+    job = get_owned_job(job_id)
+    if not job:
+        # Rendered in place rather than redirected so the 404 status reaches the client
+        flash('Analysis job not found', 'error')
+        return render_template('index.html'), 404
+    
+    # Running jobs render an empty table that fills in from the results stream
+    streaming = job['status'] in ('queued', 'running')
+    results = [] if streaming else JOB_STORE.get_results(job_id, 1, JOB_PAGE_SIZE)
+    
+    # Exports from this page cover this job
+    session['analysis_id'] = job_id
+    
+    return render_template('results.html',
+                         results=results,
+                         summary=job_summary(job),
+                         job=job,
+                         streaming=streaming,
+                         page_size=JOB_PAGE_SIZE)
 
 if __name__ == '__main__':
     print("🚀 Starting SafeSpace.AI (Groq-powered)...")
@@ -1,26 +1,70 @@
-import gradio as gr
 import pandas as pd
-from transformers import pipeline
 import io
 import csv
 from datetime import datetime
 import tempfile
 import os
+import threading
+import time
 
-# Initialize the toxicity detection pipeline
-print("Loading AI model for toxicity detection...")
-try:
-    classifier = pipeline(
-        "text-classification",
-        model="unitary/toxic-bert",
-        tokenizer="unitary/toxic-bert"
-    )
-    model_loaded = True
-    print("✅ AI model loaded successfully!")
-except Exception as e:
-    print(f"❌ Failed to load AI model: {e}")
-    classifier = None
-    model_loaded = False
+from toxicity_model import load_model, warm_up_model
+from inference_pool import InferencePool, INFERENCE_WORKERS, INFERENCE_POOL_MIN_BATCH
+from chunking import needs_chunking, score_long_texts
+from bulk_ingest import MESSAGE_COLUMNS, USER_COLUMNS, TIMESTAMP_COLUMNS, find_column
+
+# The model is loaded in the background; requests use keyword detection until it is ready
+classifier = None
+model_ready = threading.Event()
+
+# Worker processes for bulk analysis, started once the in-process model is ready
+inference_pool = None
+
+# Rows read from an uploaded file per batch; memory depends on this, not on the file size
+FILE_CHUNK_ROWS = int(os.environ.get('FILE_CHUNK_ROWS', '5000'))
+# Rows shown in the results table for a file upload; every row still goes to the export
+FILE_PREVIEW_ROWS = 1000
+# Users and days listed in a file upload's summary
+SUMMARY_TOP_N = 5
+
+def load_model_in_background():
+    """Load and warm up the model, then set model_ready"""
+    global classifier
+
+    print("Loading AI model for toxicity detection...")
+    start_time = time.time()
+    try:
+        model = load_model()
+        print(f"✅ AI model loaded in {time.time() - start_time:.1f}s - warming up...")
+        warm_up_model(model)
+        classifier = model
+        model_ready.set()
+        print(f"🔥 AI model ready after {time.time() - start_time:.1f}s")
+    except Exception as e:
+        print(f"❌ Failed to load AI model: {e}")
+        classifier = None
+        return
+
+    start_inference_pool()
+
+def start_inference_pool():
+    """Start the multi-process pool used for bulk analysis"""
+    global inference_pool
+
+    if INFERENCE_WORKERS < 2:
+        return
+    try:
+        pool = InferencePool()
+        workers = pool.warm_up()
+        inference_pool = pool
+        print(f"🧵 Inference pool ready with {len(workers)} worker processes")
+    except Exception as e:
+        print(f"⚠️ Could not start inference pool, using in-process model: {e}")
+
+def start_model_loader():
+    """Start loading the model without blocking server startup"""
+    loader = threading.Thread(target=load_model_in_background, name="model-loader", daemon=True)
+    loader.start()
+    return loader
 
 # Fallback keyword detection
 TOXIC_KEYWORDS = [
@@ -33,26 +77,32 @@ def classify_toxicity(text):
     if not text or not text.strip():
         return "SAFE", 0.1, "Empty message"
     
-    text = text.strip()
-    
-    # Try AI model first
-    if model_loaded and classifier:
-        try:
-            result = classifier(text)
-            if isinstance(result, list) and len(result) > 0:
-                prediction = result[0]
-                label = prediction.get('label', 'SAFE')
-                confidence = prediction.get('score', 0.5)
-                
-                # Convert labels to our format
-                if label in ['TOXIC', 'toxic', '1']:
-                    return "TOXIC", confidence, "AI Model"
-                else:
-                    return "SAFE", confidence, "AI Model"
-        except Exception as e:
-            print(f"AI model error: {e}")
+    classification, confidence, method, span = classify_messages([text.strip()])[0]
+    return classification, confidence, method
+
+def interpret_prediction(prediction):
+    """Convert a model prediction to our (classification, confidence, method) format"""
+    label = prediction.get('label', 'SAFE')
+    confidence = prediction.get('score', 0.5)
     
-    # Fallback to keyword detection
+    if label in ['TOXIC', 'toxic', '1']:
+        return "TOXIC", confidence, "AI Model"
+    else:
+        return "SAFE", confidence, "AI Model"
+
+def toxicity_probability(prediction):
+    """Probability that a model prediction is toxic"""
+    classification, confidence, method = interpret_prediction(prediction)
+    return confidence if classification == "TOXIC" else 1 - confidence
+
+def decide(probability, method, span=None):
+    """The verdict for a toxicity probability, the same for whole and chunked messages"""
+    if probability >= 0.5:
+        return "TOXIC", probability, method, span
+    return "SAFE", 1 - probability, method, None
+
+def classify_with_keywords(text):
+    """Fallback keyword detection"""
     text_lower = text.lower()
     for keyword in TOXIC_KEYWORDS:
         if keyword in text_lower:
@@ -60,49 +110,95 @@ def classify_toxicity(text):
     
     return "SAFE", 0.8, "Keyword Detection"
 
-def analyze_text(text_input):
-    """Analyze text input from the textarea"""
-    if not text_input:
-        return "Please enter some text to analyze.", None, None
-    
-    messages = [line.strip() for line in text_input.split('\n') if line.strip()]
-    if not messages:
-        return "No valid messages found.", None, None
-    
-    results = []
-    toxic_count = 0
+def predict(texts):
+    """Run the model over a batch, using the worker pool for large batches"""
+    if inference_pool and len(texts) >= INFERENCE_POOL_MIN_BATCH:
+        return inference_pool.classify(texts)
+    return classifier(texts)
+
+def classify_messages(messages):
+    """Classify a batch of messages
+
+    Returns (classification, confidence, method, span) per message. Messages longer
+    than the model window are scored as overlapping chunks; both are TOXIC when the
+    toxicity probability is at least 0.5 (see decide). span holds the
+    character offsets of the offending chunk when such a message is toxic.
+    """
+    # Try AI model first, once it has finished loading and warming up
+    if model_ready.is_set() and classifier:
+        try:
+            tokenizer = getattr(classifier, 'tokenizer', None)
+            results = [None] * len(messages)
+            long_indexes = [i for i, message in enumerate(messages) if needs_chunking(message, tokenizer)]
+            long_set = set(long_indexes)
+            short_indexes = [i for i in range(len(messages)) if i not in long_set]
+            
+            if short_indexes:
+                predictions = predict([messages[i] for i in short_indexes])
+                for i, prediction in zip(short_indexes, predictions):
+                    results[i] = decide(toxicity_probability(prediction), "AI Model")
+            
+            if long_indexes:
+                # All windows of all long messages go through the model as one batch
+                chunked = score_long_texts(
+                    [messages[i] for i in long_indexes],
+                    lambda chunks: [toxicity_probability(p) for p in predict(chunks)],
+                    tokenizer
+                )
+                for i, scored in zip(long_indexes, chunked):
+                    results[i] = decide(scored['score'], "AI Model (chunked)", scored['span'])
+            
+            return results
+        except Exception as e:
+            print(f"AI model error: {e}")
     
-    for i, message in enumerate(messages, 1):
-        classification, confidence, method = classify_toxicity(message)
-        
-        if classification == "TOXIC":
-            toxic_count += 1
-            action = "⚠️ Review Needed"
-            color = "🔴"
-        else:
-            action = "✅ No Action"
-            color = "🟢"
-        
-        results.append({
-            'Message #': i,
-            'Message': message[:100] + "..." if len(message) > 100 else message,
-            'Classification': f"{color} {classification}",
-            'Confidence': f"{confidence:.2f}",
-            'Method': method,
-            'Action': action
-        })
+    return [classify_with_keywords(message) + (None,) for message in messages]
+
+def describe_span(message, span):
+    """Short description of the offending span of a chunked message"""
+    if not span:
+        return ""
+    start, end = span
+    excerpt = message[start:end]
+    if len(excerpt) > 100:
+        excerpt = excerpt[:100] + "..."
+    return f"chars {start}-{end}: {excerpt}"
+
+def result_row(number, message, classification, confidence, method, span, user=None, timestamp=None,
+               with_sender=False):
+    """One row of the results table"""
+    if classification == "TOXIC":
+        action = "⚠️ Review Needed"
+        color = "🔴"
+    else:
+        action = "✅ No Action"
+        color = "🟢"
     
-    total_messages = len(messages)
+    row = {'Message #': number}
+    if with_sender:
+        row['User'] = user or ''
+        row['Timestamp'] = timestamp or ''
+    row.update({
+        'Message': message[:100] + "..." if len(message) > 100 else message,
+        'Classification': f"{color} {classification}",
+        'Confidence': f"{confidence:.2f}",
+        'Method': method,
+        'Flagged Span': describe_span(message, span),
+        'Action': action
+    })
+    return row
+
+def summarize(total_messages, toxic_count):
+    """Markdown summary with the risk recommendation"""
     safe_count = total_messages - toxic_count
     toxicity_rate = (toxic_count / total_messages) * 100
     
-    # Create summary
     summary = f"""
 ## 📊 Analysis Summary
 - **Total Messages**: {total_messages}
 - **🚨 Toxic Messages**: {toxic_count} ({toxicity_rate:.1f}%)
 - **✅ Safe Messages**: {safe_count} ({100-toxicity_rate:.1f}%)
-- **🤖 AI Model Status**: {'✅ Active' if model_loaded else '⚠️ Using Keywords'}
+- **🤖 AI Model Status**: {'✅ Active' if model_ready.is_set() else '⏳ Loading - Using Keywords'}
 
 ### 📋 Recommendations:
 """
@@ -116,47 +212,149 @@ def analyze_text(text_input):
     else:
         summary += "✅ **Healthy Communication**: No toxic content detected"
     
+    return summary
+
+def analyze_text(text_input):
+    """Analyze text input from the textarea"""
+    if not text_input:
+        return "Please enter some text to analyze.", None, None
+    
+    messages = [line.strip() for line in text_input.split('\n') if line.strip()]
+    if not messages:
+        return "No valid messages found.", None, None
+    
+    classifications = classify_messages(messages)
+    results = [
+        result_row(i, message, *classification)
+        for i, (message, classification) in enumerate(zip(messages, classifications), 1)
+    ]
+    toxic_count = sum(1 for classification, _, _, _ in classifications if classification == "TOXIC")
+    
     # Convert results to DataFrame for display
     df = pd.DataFrame(results)
     
-    return summary, df, results
+    return summarize(len(messages), toxic_count), df, results
+
+def iter_file_batches(path, chunk_rows=FILE_CHUNK_ROWS):
+    """Stream (messages, users, timestamps) column batches from an uploaded CSV or text file
+    
+    CSV files are read in pandas chunks with only the message, user and timestamp
+    columns parsed, so memory stays flat however many rows the export has.
+    """
+    if path.lower().endswith('.csv'):
+        header = list(pd.read_csv(path, nrows=0).columns)
+        message_col = find_column(header, MESSAGE_COLUMNS) or header[0]
+        user_col = find_column(header, USER_COLUMNS)
+        timestamp_col = find_column(header, TIMESTAMP_COLUMNS)
+        columns = list(dict.fromkeys(col for col in (message_col, user_col, timestamp_col) if col is not None))
+        
+        for chunk in pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+            chunk = chunk.apply(lambda column: column.str.strip())
+            chunk = chunk[chunk[message_col] != '']
+            if chunk.empty:
+                continue
+            empty = [None] * len(chunk)
+            # Blank cells become None (Series.replace('', None) gives NaN on pandas' string dtype)
+            yield (
+                chunk[message_col].tolist(),
+                [value or None for value in chunk[user_col].tolist()] if user_col else empty,
+                [value or None for value in chunk[timestamp_col].tolist()] if timestamp_col else empty
+            )
+        return
+    
+    # Plain text: one message per line
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        batch = []
+        for line in f:
+            line = line.strip()
+            if line:
+                batch.append(line)
+            if len(batch) >= chunk_rows:
+                yield batch, [None] * len(batch), [None] * len(batch)
+                batch = []
+        if batch:
+            yield batch, [None] * len(batch), [None] * len(batch)
+
+def top_entries(stats, key):
+    """The SUMMARY_TOP_N entries of a {name: [total, toxic]} dict, ordered by key"""
+    return sorted(stats.items(), key=key, reverse=True)[:SUMMARY_TOP_N]
 
 def analyze_file(file):
-    """Analyze uploaded file"""
+    """Analyze uploaded file
+    
+    Batches stream from the file straight into the classifier. Rows are written to
+    a CSV export as they are classified and only per-user and per-day counters are
+    kept, so a file with millions of rows is handled in constant memory.
+    """
     if file is None:
         return "Please upload a file.", None, None
     
+    export_path = None
     try:
-        # Read file content
-        if file.name.endswith('.csv'):
-            df = pd.read_csv(file.name)
-            # Try to find message column
-            message_columns = ['message', 'text', 'content', 'chat', 'comment']
-            message_col = None
-            
-            for col in df.columns:
-                if col.lower() in message_columns:
-                    message_col = col
-                    break
-            
-            if message_col is None:
-                message_col = df.columns[0]  # Use first column
+        total_messages = 0
+        toxic_count = 0
+        user_stats = {}
+        day_stats = {}
+        preview = []
+        has_senders = False
+        
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as export_file:
+            export_path = export_file.name
+            writer = None
             
-            messages = df[message_col].dropna().astype(str).tolist()
-        else:
-            # Assume text file
-            with open(file.name, 'r', encoding='utf-8') as f:
-                content = f.read()
-            messages = [line.strip() for line in content.split('\n') if line.strip()]
+            for messages, users, timestamps in iter_file_batches(file.name):
+                has_senders = has_senders or any(users) or any(timestamps)
+                classifications = classify_messages(messages)
+                
+                for message, user, timestamp, classification in zip(messages, users, timestamps, classifications):
+                    total_messages += 1
+                    is_toxic = classification[0] == "TOXIC"
+                    toxic_count += is_toxic
+                    
+                    if user:
+                        stats = user_stats.setdefault(user, [0, 0])
+                        stats[0] += 1
+                        stats[1] += is_toxic
+                    if timestamp:
+                        # ISO-style timestamps start with the date
+                        stats = day_stats.setdefault(timestamp[:10], [0, 0])
+                        stats[0] += 1
+                        stats[1] += is_toxic
+                    
+                    row = result_row(total_messages, message, *classification, user, timestamp, with_sender=True)
+                    if writer is None:
+                        writer = csv.DictWriter(export_file, fieldnames=list(row.keys()))
+                        writer.writeheader()
+                    writer.writerow(row)
+                    if len(preview) < FILE_PREVIEW_ROWS:
+                        preview.append(row)
         
-        if not messages:
+        if not total_messages:
+            os.unlink(export_path)
             return "No messages found in the file.", None, None
         
-        # Join messages and analyze
-        text_input = '\n'.join(messages)
-        return analyze_text(text_input)
+        summary = summarize(total_messages, toxic_count)
+        if user_stats:
+            summary += "\n\n### 👥 Users With Most Toxic Messages:\n"
+            for user, (total, toxic) in top_entries(user_stats, lambda item: (item[1][1], item[1][0])):
+                summary += f"- **{user}**: {toxic} toxic of {total} messages\n"
+        if day_stats:
+            summary += "\n### 📅 Days With Most Toxic Messages:\n"
+            for day, (total, toxic) in top_entries(day_stats, lambda item: (item[1][1], item[1][0])):
+                summary += f"- **{day}**: {toxic} toxic of {total} messages\n"
+        if total_messages > len(preview):
+            summary += f"\n_Showing the first {len(preview)} of {total_messages} messages - export for the full results._"
+        
+        df = pd.DataFrame(preview)
+        if not has_senders:
+            df = df.drop(columns=['User', 'Timestamp'])
+        
+        # The export already holds every row, so the state keeps its path instead of the rows
+        return summary, df, export_path
         
     except Exception as e:
+        if export_path and os.path.exists(export_path):
+            os.unlink(export_path)
         return f"Error processing file: {str(e)}", None, None
 
 def export_results(results_data):
@@ -164,6 +362,10 @@ def export_results(results_data):
     if not results_data:
         return None
     
+    # File uploads are exported while they are analyzed
+    if isinstance(results_data, str):
+        return results_data
+    
     # Create temporary file
     temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='')
     
@@ -183,6 +385,10 @@ def export_results(results_data):
 
 # Create Gradio interface
 def create_interface():
+    # Imported here: spawned inference workers re-run this module's top level as
+    # __mp_main__, and they have no use for the UI library
+    import gradio as gr
+    
     with gr.Blocks(title="SafeSpace.AI - Workplace Harassment Detector", theme=gr.themes.Soft()) as app:
         
         # Header
@@ -286,4 +492,7 @@ def create_interface():
 # Create and launch the app
 if __name__ == "__main__":
     app = create_interface()
-    app.launch()
\ No newline at end of file
+    # Bring the server up first, then load and warm up the model in the background
+    app.launch(prevent_thread_lock=True)
+    start_model_loader()
+    app.block_thread()
\ No newline at end of file
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+SafeSpace.AI - PyTorch vs ONNX Runtime Benchmark
+===============================================
+
+Compares the transformers pipeline (PyTorch FP32) with the exported ONNX models
+(FP32 and int8-quantized) on our test message sets.
+
+Reports for each backend:
+- Model load time and peak RSS (each backend runs in its own process)
+- Single-message latency (p50 / p95)
+- Batched throughput (messages per second)
+- Agreement with the PyTorch predictions (label and toxic/safe decision)
+
+Usage:
+    python export_onnx.py          # once, to produce the ONNX models
+    python benchmark_onnx.py
+    python benchmark_onnx.py --files test_messages.txt --batch-size 16
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+DEFAULT_TEST_FILES = [
+    'test_messages_new.txt',
+    'test_messages.txt',
+    'test_mixed_messages.txt',
+    'test_bulk_messages.txt',
+    'bulk_upload_test.txt',
+    'test_chat.csv'
+]
+
+BACKENDS = ['pytorch', 'onnx-fp32', 'onnx-int8']
+TOXIC_LABELS = ['TOXIC', 'toxic', '1']
+
+
+def load_messages(paths):
+    """Load non-empty messages from .txt (one per line) and .csv (message column) files"""
+    messages = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Skipping missing test file: {path}", file=sys.stderr)
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.csv'):
+                for row in csv.DictReader(f):
+                    message = (row.get('message') or '').strip()
+                    if message:
+                        messages.append(message)
+            else:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        message = line.strip('"').strip('“”').strip("'").strip()
+                        if message:
+                            messages.append(message)
+    return messages
+
+
+def load_backend(name, model_dir, intra_threads, inter_threads):
+    """Load one classifier backend by name"""
+    if name == 'pytorch':
+        from transformers import pipeline
+        return pipeline("text-classification", model="unitary/toxic-bert", tokenizer="unitary/toxic-bert")
+
+    from onnx_backend import ONNXToxicityClassifier
+    model_file = 'model.quant.onnx' if name == 'onnx-int8' else 'model.onnx'
+    return ONNXToxicityClassifier(
+        model_dir=model_dir,
+        model_file=model_file,
+        intra_op_threads=intra_threads,
+        inter_op_threads=inter_threads
+    )
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_backend(name, messages, args):
+    """Benchmark a single backend in the current process and return its metrics"""
+    load_start = time.perf_counter()
+    classifier = load_backend(name, args.model_dir, args.intra_threads, args.inter_threads)
+    load_seconds = time.perf_counter() - load_start
+
+    # Warm up so one-time kernel selection does not skew the latency numbers
+    for message in messages[:args.warmup]:
+        classifier(message)
+
+    latencies = []
+    predictions = []
+    for message in messages:
+        start = time.perf_counter()
+        prediction = classifier(message)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        predictions.append({'label': prediction['label'], 'score': float(prediction['score'])})
+
+    start = time.perf_counter()
+    for offset in range(0, len(messages), args.batch_size):
+        classifier(messages[offset:offset + args.batch_size])
+    batch_seconds = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {
+        'backend': name,
+        'load_seconds': round(load_seconds, 2),
+        'latency_p50_ms': round(percentile(latencies, 50), 2),
+        'latency_p95_ms': round(percentile(latencies, 95), 2),
+        'throughput_msgs_per_sec': round(len(messages) / batch_seconds, 1) if batch_seconds > 0 else 0,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'predictions': predictions
+    }
+
+
+def agreement(reference, candidate):
+    """Fraction of messages where the candidate matches the reference label and decision"""
+    total = len(reference)
+    if total == 0:
+        return 0.0, 0.0, 0.0
+    same_label = sum(1 for r, c in zip(reference, candidate) if r['label'] == c['label'])
+    same_decision = sum(
+        1 for r, c in zip(reference, candidate)
+        if (r['label'] in TOXIC_LABELS) == (c['label'] in TOXIC_LABELS)
+    )
+    max_score_diff = max(abs(r['score'] - c['score']) for r, c in zip(reference, candidate))
+    return same_label / total, same_decision / total, max_score_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PyTorch vs ONNX Runtime toxicity backends")
+    parser.add_argument('--files', nargs='+', default=DEFAULT_TEST_FILES, help="Test message files")
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--model-dir', default=os.environ.get('ONNX_MODEL_DIR', 'models/toxic-bert-onnx'))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--intra-threads', type=int, default=None, help="ONNX intra-op threads (default: all cores)")
+    parser.add_argument('--inter-threads', type=int, default=None, help="ONNX inter-op threads")
+    parser.add_argument('--single-backend', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    messages = load_messages(args.files)
+
+    # Child mode: benchmark exactly one backend and report JSON on stdout
+    if args.single_backend:
+        print(json.dumps(run_backend(args.single_backend, messages, args)))
+        return
+
+    print("🚀 SafeSpace.AI - PyTorch vs ONNX Runtime Benchmark")
+    print("=" * 60)
+    print(f"📁 Messages: {len(messages)} from {len(args.files)} files")
+    if not messages:
+        print("❌ No messages to benchmark!")
+        return
+
+    results = {}
+    for backend in args.backends:
+        print(f"\n⏱️ Benchmarking {backend}...")
+        # Separate processes keep the peak RSS of each backend independent
+        command = [sys.executable, os.path.abspath(__file__), '--single-backend', backend] + sys.argv[1:]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"❌ {backend} failed:\n{completed.stderr.strip()[-500:]}")
+            continue
+        results[backend] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print("\n" + "=" * 60)
+    print("📊 BENCHMARK RESULTS")
+    print("=" * 60)
+    print(f"{'Backend':<12}{'Load s':>9}{'p50 ms':>10}{'p95 ms':>10}{'msg/s':>10}{'RSS MB':>10}")
+    for backend, metrics in results.items():
+        print(f"{backend:<12}{metrics['load_seconds']:>9}{metrics['latency_p50_ms']:>10}"
+              f"{metrics['latency_p95_ms']:>10}{metrics['throughput_msgs_per_sec']:>10}{metrics['peak_rss_mb']:>10}")
+
+    reference = results.get('pytorch')
+    if reference:
+        print("\n🔍 Agreement with PyTorch:")
+        for backend, metrics in results.items():
+            if backend == 'pytorch':
+                continue
+            label_rate, decision_rate, max_diff = agreement(reference['predictions'], metrics['predictions'])
+            print(f"   {backend}: label {label_rate:.1%}, toxic/safe decision {decision_rate:.1%}, "
+                  f"max score diff {max_diff:.4f}")
+
+
+if __name__ == "__main__":
+    main()
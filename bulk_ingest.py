@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Bulk upload parsing for SafeSpace.AI
+Turns uploaded chat logs into individual messages. Plain text files hold one
+message per line; CSV exports (e.g. timestamp,user,message like test_chat.csv)
+keep their user and timestamp columns alongside each message.
+
+Uploads are decoded and parsed incrementally from the spooled file, so memory
+use stays constant however large the file is and analysis can start on the
+first messages while the rest of the file is still being parsed.
+"""
+
+import os
+import csv
+import codecs
+from itertools import chain
+
+# Column names recognised as the message text in CSV uploads
+MESSAGE_COLUMNS = ['message', 'text', 'content', 'chat', 'comment']
+USER_COLUMNS = ['user', 'username', 'author', 'sender', 'from', 'email']
+TIMESTAMP_COLUMNS = ['timestamp', 'time', 'date', 'datetime', 'sent_at', 'created_at']
+
+# How undecodable bytes are handled: "replace" keeps the rest of the upload, "strict" rejects it
+UPLOAD_DECODE_ERRORS = os.environ.get('UPLOAD_DECODE_ERRORS', 'replace')
+UPLOAD_READ_CHUNK = 64 * 1024
+
+
+def find_column(fieldnames, candidates):
+    """Return the first header matching one of the candidate names (case-insensitive)"""
+    for name in fieldnames:
+        if name and name.strip().lower() in candidates:
+            return name
+    return None
+
+
+def message_key(message):
+    """Normalized form used to spot repeated messages ("OK", "ok ", "ok") in a batch"""
+    return ' '.join(message.split()).casefold()
+
+
+def looks_like_csv(filename, first_line):
+    """Detect CSV uploads by extension, or by a header row naming a message column"""
+    if filename and filename.lower().endswith('.csv'):
+        return True
+    if ',' not in first_line:
+        return False
+    header = [column.strip().lower() for column in next(csv.reader([first_line]))]
+    return any(column in MESSAGE_COLUMNS for column in header)
+
+
+def iter_decoded_lines(stream, errors=UPLOAD_DECODE_ERRORS, chunk_size=UPLOAD_READ_CHUNK):
+    """Decode a binary stream as UTF-8 in chunks, yielding lines with their newline kept"""
+    # utf-8-sig drops the byte-order mark Excel and other Windows tools prepend
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors=errors)
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        # Multi-byte characters split across chunks are held back by the decoder
+        parts = (pending + decoder.decode(chunk, final=not chunk)).split('\n')
+        pending = parts.pop()
+        for part in parts:
+            yield part + '\n'
+        if not chunk:
+            if pending:
+                yield pending
+            return
+
+
+def iter_text_messages(lines):
+    """One message per non-empty line"""
+    for line in lines:
+        message = line.strip()
+        if message:
+            yield {'message': message, 'user': None, 'timestamp': None}
+
+
+def iter_csv_messages(lines):
+    """Messages from a CSV export, keeping user and timestamp columns when present"""
+    reader = csv.DictReader(lines)
+    fieldnames = reader.fieldnames or []
+    if not fieldnames:
+        return
+
+    message_col = find_column(fieldnames, MESSAGE_COLUMNS) or fieldnames[0]
+    user_col = find_column(fieldnames, USER_COLUMNS)
+    timestamp_col = find_column(fieldnames, TIMESTAMP_COLUMNS)
+
+    for row in reader:
+        message = (row.get(message_col) or '').strip()
+        if not message:
+            continue
+        yield {
+            'message': message,
+            'user': (row.get(user_col) or '').strip() or None if user_col else None,
+            'timestamp': (row.get(timestamp_col) or '').strip() or None if timestamp_col else None
+        }
+
+
+def iter_upload_messages(stream, filename):
+    """Lazily split an uploaded file into message dicts with message, user and timestamp keys"""
+    lines = iter_decoded_lines(stream)
+    first_line = next(lines, None)
+    if first_line is None:
+        return iter(())
+
+    lines = chain([first_line], lines)
+    if looks_like_csv(filename, first_line):
+        return iter_csv_messages(lines)
+    return iter_text_messages(lines)
+
+
+def parse_text_messages(text):
+    """One message per non-empty line of an in-memory string"""
+    return list(iter_text_messages(text.split('\n')))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Long-message chunking for SafeSpace.AI
+Splits long texts into overlapping token windows, scores all windows as one
+batch and combines the window scores into a single verdict that points at the
+offending span, instead of silently truncating at the model's max length.
+"""
+
+import os
+import re
+import math
+
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', '256'))
+CHUNK_STRIDE_TOKENS = int(os.environ.get('CHUNK_STRIDE_TOKENS', '64'))
+# "max" flags the worst window; "attention" softmax-weights windows by their own score
+CHUNK_COMBINE_METHOD = os.environ.get('CHUNK_COMBINE_METHOD', 'max')
+ATTENTION_TEMPERATURE = 0.1
+
+WORD_PATTERN = re.compile(r'\S+')
+
+
+def token_offsets(text, tokenizer=None):
+    """Return (start, end) character offsets for each token of the text
+
+    Uses the model tokenizer's offset mapping when available so windows line up
+    with the model's max sequence length; otherwise falls back to whitespace words.
+    """
+    if tokenizer is not None:
+        try:
+            encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return [tuple(offset) for offset in encoded['offset_mapping']]
+        except Exception:
+            # Slow tokenizers do not support offset mapping
+            pass
+    return [match.span() for match in WORD_PATTERN.finditer(text)]
+
+
+def split_into_windows(text, tokenizer=None, max_tokens=CHUNK_MAX_TOKENS, stride=CHUNK_STRIDE_TOKENS):
+    """Split text into overlapping windows of at most max_tokens tokens
+
+    Returns a list of (start, end) character spans; consecutive windows share
+    `stride` tokens so a toxic phrase is never cut in half at a boundary.
+    """
+    offsets = token_offsets(text, tokenizer)
+    if len(offsets) <= max_tokens:
+        return [(0, len(text))]
+
+    step = max(1, max_tokens - stride)
+    windows = []
+    for first in range(0, len(offsets), step):
+        last = min(first + max_tokens, len(offsets)) - 1
+        windows.append((offsets[first][0], offsets[last][1]))
+        if last == len(offsets) - 1:
+            break
+    return windows
+
+
+def needs_chunking(text, tokenizer=None, max_tokens=CHUNK_MAX_TOKENS):
+    """Check whether a text is longer than a single window"""
+    # Cheap pre-check: every token spans at least one character
+    if len(text) <= max_tokens:
+        return False
+    return len(token_offsets(text, tokenizer)) > max_tokens
+
+
+def combine_scores(scores, method=CHUNK_COMBINE_METHOD):
+    """Combine per-window toxicity scores, returning (score, index of the offending window)"""
+    best = max(range(len(scores)), key=lambda i: scores[i])
+    if method != 'attention':
+        return scores[best], best
+
+    # Attention-style pooling: windows with higher scores get exponentially more weight,
+    # so one clearly toxic window dominates without ignoring the rest of the text
+    peak = scores[best]
+    weights = [math.exp((score - peak) / ATTENTION_TEMPERATURE) for score in scores]
+    total = sum(weights)
+    return sum(w * s for w, s in zip(weights, scores)) / total, best
+
+
+def score_long_texts(texts, score_batch, tokenizer=None, max_tokens=CHUNK_MAX_TOKENS,
+                     stride=CHUNK_STRIDE_TOKENS, method=CHUNK_COMBINE_METHOD):
+    """Score texts of any length with one batched model call over all windows
+
+    score_batch takes a list of strings and returns one toxicity probability per
+    string. Returns one dict per text with the combined score, the character
+    span of the most toxic window and the number of windows scored.
+    """
+    spans_per_text = [split_into_windows(text, tokenizer, max_tokens, stride) for text in texts]
+    chunks = [text[start:end] for text, spans in zip(texts, spans_per_text) for start, end in spans]
+    chunk_scores = score_batch(chunks) if chunks else []
+
+    results = []
+    position = 0
+    for text, spans in zip(texts, spans_per_text):
+        scores = chunk_scores[position:position + len(spans)]
+        position += len(spans)
+        score, best = combine_scores(scores, method)
+        results.append({
+            'score': score,
+            'span': spans[best],
+            'span_text': text[spans[best][0]:spans[best][1]],
+            'windows': len(spans)
+        })
+    return results
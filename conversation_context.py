@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Conversation context engine for SafeSpace.AI
+Decides whether a toxic message should be removed from a cleaned transcript or
+rewritten, based on the message itself and a fixed-size window of neighbouring
+messages.
+
+A transcript is handled in one streaming pass: each message's features are
+computed once, and the window keeps running counts of its neighbours' words and
+tone that are updated as messages enter and leave it. Cost is linear in the
+number of messages however large the window is.
+"""
+
+import os
+import re
+from collections import Counter, deque
+
+# Neighbouring messages considered on each side of a message
+CONTEXT_WINDOW = int(os.environ.get('CONTEXT_WINDOW', '2'))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+PERSONAL_TARGETS = {'you', "you're", 'youre', 'your', "you've", 'yourself', 'u', 'ur'}
+ATTACK_WORDS = {
+    'idiot', 'stupid', 'dumb', 'moron', 'loser', 'hate', 'pathetic', 'worthless', 'useless',
+    'incompetent', 'fool', 'ugly', 'disgusting', 'clown', 'shut', 'trash', 'garbage'
+}
+# Words that point at the work being discussed rather than at a person
+TOPIC_WORDS = {
+    'this', 'that', 'it', 'project', 'plan', 'idea', 'approach', 'meeting', 'presentation',
+    'code', 'design', 'deadline', 'task', 'report', 'proposal', 'process', 'decision', 'time',
+    'feature', 'release', 'budget', 'schedule', 'change', 'review', 'waste', 'document', 'spec'
+}
+POSITIVE_WORDS = {
+    'thanks', 'thank', 'great', 'appreciate', 'good', 'well', 'awesome', 'hope', 'glad', 'nice',
+    'excellent', 'love', 'helpful', 'collaboration', 'welcome', 'congrats', 'happy'
+}
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'was', 'with', 'have', 'has', 'had', 'but', 'not', 'all', 'any',
+    'can', 'our', 'out', 'about', 'just', 'what', 'when', 'who', 'how', 'its', "it's", "i'm",
+    'from', 'they', 'them', 'then', 'than', 'there', 'their', 'will', 'would', 'should', 'could',
+    'been', 'being', 'also', 'very', 'really', 'today', 'everyone', 'team'
+}
+
+
+def message_features(text):
+    """Context features of one message, computed once per message"""
+    tokens = TOKEN_PATTERN.findall(text.lower().replace('’', "'"))
+    token_set = set(tokens)
+    return {
+        'targets_person': bool(token_set & PERSONAL_TARGETS),
+        'attack': bool(token_set & ATTACK_WORDS),
+        'topical': bool(token_set & TOPIC_WORDS),
+        'positive': bool(token_set & POSITIVE_WORDS),
+        # Content words link a message to the discussion around it
+        'words': {
+            token for token in token_set
+            if len(token) > 2 and token not in STOPWORDS and token not in ATTACK_WORDS
+            and token not in PERSONAL_TARGETS
+        }
+    }
+
+
+class ContextWindow:
+    """Running totals over the messages currently inside the sliding window"""
+
+    def __init__(self):
+        self.size = 0
+        self.positive = 0
+        self.words = Counter()
+
+    def add(self, features):
+        self.size += 1
+        self.positive += features['positive']
+        self.words.update(features['words'])
+
+    def remove(self, features):
+        self.size -= 1
+        self.positive -= features['positive']
+        # Words that left the window are deleted, so memory follows the window, not the transcript
+        for word in features['words']:
+            if self.words[word] > 1:
+                self.words[word] -= 1
+            else:
+                self.words.pop(word, None)
+
+
+def decide_action(features, window, includes_self=False):
+    """Return ("remove" | "rewrite", reason) for a toxic message given its window
+
+    With includes_self the window totals also count the message itself, which is
+    subtracted here rather than removing and re-adding it.
+    """
+    own = 1 if includes_self else 0
+    neighbours = window.size - own
+    positive_neighbours = window.positive - (features['positive'] if includes_self else 0)
+    shared_words = sum(1 for word in features['words'] if window.words[word] > own)
+
+    if features['targets_person'] and features['attack'] and not features['topical']:
+        if shared_words:
+            return 'rewrite', "Personal attack within an ongoing discussion - rewritten to keep the point"
+        if neighbours and positive_neighbours * 2 >= neighbours:
+            return 'remove', "Out-of-context personal attack in an otherwise positive conversation"
+        return 'remove', "Personal attack unrelated to the surrounding conversation"
+
+    if features['topical'] or shared_words:
+        return 'rewrite', "Criticism of the work under discussion - rewritten constructively"
+    return 'remove', "Hostile message with no content worth preserving"
+
+
+def _iter_decisions(items, text_of, window):
+    """Yield (item, action, reason) for each item in one pass with a sliding window"""
+    context = ContextWindow()
+    buffer = deque()
+    center = 0
+    for item in items:
+        features = message_features(text_of(item))
+        buffer.append((item, features))
+        context.add(features)
+        # Decide the center message once its right-hand neighbours have arrived
+        if len(buffer) - 1 - center >= window:
+            center_item, center_features = buffer[center]
+            yield (center_item,) + decide_action(center_features, context, includes_self=True)
+            center += 1
+            if center > window:
+                context.remove(buffer.popleft()[1])
+                center -= 1
+
+    while center < len(buffer):
+        center_item, center_features = buffer[center]
+        yield (center_item,) + decide_action(center_features, context, includes_self=True)
+        center += 1
+        if center > window:
+            context.remove(buffer.popleft()[1])
+            center -= 1
+
+
+def iter_context_decisions(texts, window=CONTEXT_WINDOW):
+    """Yield (action, reason) for every message of a transcript, in order"""
+    for _, action, reason in _iter_decisions(texts, lambda text: text, window):
+        yield action, reason
+
+
+def annotate_context(messages, window=CONTEXT_WINDOW):
+    """Add context_action and context_reason to a stream of message dicts
+
+    Each message is yielded `window` messages after it arrives, so the pass works
+    on uploads that are still being parsed.
+    """
+    for message, action, reason in _iter_decisions(messages, lambda message: message['message'], window):
+        yield {**message, 'context_action': action, 'context_reason': reason}
+
+
+def decide_in_context(messages, index, window=CONTEXT_WINDOW):
+    """Decision for a single message of a transcript, looking only at its window"""
+    context = ContextWindow()
+    for neighbour in messages[max(0, index - window):index] + messages[index + 1:index + 1 + window]:
+        context.add(message_features(neighbour))
+    return decide_action(message_features(messages[index]), context)
@@ -4,11 +4,12 @@ Direct Sample Data Generator for SafeSpace.AI
 Directly adds sample analysis logs to demonstrate dashboard analytics
 """
 
-import json
 import os
 from datetime import datetime, timedelta
 import random
 
+from analysis_log import AnalysisLog
+
 # Sample analysis data
 SAMPLE_ANALYSES = [
     # Safe messages
@@ -70,17 +71,10 @@ SAMPLE_ANALYSES = [
 def generate_sample_logs():
     """Generate sample analysis logs with realistic timestamps"""
     
-    log_file = "analysis_logs.json"
-    
-    # Load existing logs if they exist
-    existing_logs = []
-    if os.path.exists(log_file):
-        try:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                existing_logs = json.load(f)
-                print(f"📊 Found {len(existing_logs)} existing log entries")
-        except:
-            print("📊 Starting with fresh logs")
+    # Entries are appended to the log store; existing entries are never rewritten
+    log = AnalysisLog()
+    log.import_legacy()
+    log.start()
     
     # Generate timestamps over the last 7 days
     now = datetime.now()
@@ -95,7 +89,6 @@ def generate_sample_logs():
         timestamp = start_date + timedelta(hours=random_hours)
         
         log_entry = {
-            'id': len(existing_logs) + i + 1,
             'timestamp': timestamp.isoformat(),
             'user': sample['user'],
             'message': sample['message'][:200] + '...' if len(sample['message']) > 200 else sample['message'],
@@ -109,14 +102,11 @@ def generate_sample_logs():
             'removed_lines': sample.get('removed_lines', 0)
         }
         
+        log.append(log_entry)
         new_logs.append(log_entry)
     
-    # Combine existing and new logs
-    all_logs = existing_logs + new_logs
-    
-    # Save to file
-    with open(log_file, 'w', encoding='utf-8') as f:
-        json.dump(all_logs, f, indent=2, ensure_ascii=False)
+    log.flush()
+    all_logs = list(log.iter_entries())
     
     print(f"✅ Generated {len(new_logs)} new sample log entries")
     print(f"📁 Total log entries: {len(all_logs)}")
@@ -156,7 +146,7 @@ def main():
     print("  ✅ Toxicity rates and contextual rewrite statistics")
     print("\n🌐 Go to: http://127.0.0.1:5000/admin/dashboard")
     print("🔑 Login: admin@safespace.ai / admin123")
-    print("\n⚠️  Note: You may need to refresh the Flask app to load the new data")
+    print("\n⚠️  Note: Stop the Flask app before running this script - the analysis log has a single writer")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
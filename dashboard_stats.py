@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Admin dashboard counters for SafeSpace.AI
+Totals per user, label and method, plus minute/hour/day time series (rollups.py),
+are kept in a small SQLite database and updated from each batch the analysis log
+writes, so /admin reads a handful of rows instead of scanning the whole history.
+
+Each batch is applied in one transaction together with the id of the last entry
+it contains, so a restart catches up from exactly where the counters stopped.
+If the counters are ever lost or suspect, rebuild them from the raw log:
+
+    python dashboard_stats.py --rebuild
+
+The counters record every analysis as it happened. Log compaction later drops
+entries superseded by a re-logged result and retention deletes old segments,
+but neither is subtracted here, so a rebuild afterwards can report less.
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import time
+import threading
+from datetime import datetime, timedelta
+
+import rollups
+from analysis_log import iter_log_entries, ANALYSIS_LOG_DIR
+
+DASHBOARD_DB_PATH = os.environ.get('DASHBOARD_DB_PATH', 'data/dashboard.db')
+# Entries kept for the dashboard's "Recent Activity" list
+RECENT_ACTIVITY_LIMIT = 10
+TOP_USERS_LIMIT = 5
+DAILY_STATS_DAYS = 7
+# Entries applied per transaction while rebuilding or catching up
+REBUILD_CHUNK = 5000
+# Seconds between rollup compaction passes
+ROLLUP_COMPACT_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    toxic INTEGER NOT NULL DEFAULT 0,
+    safe INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key)
+);
+CREATE INDEX IF NOT EXISTS idx_counters_total ON counters (dimension, total);
+CREATE TABLE IF NOT EXISTS recent_activity (
+    id INTEGER PRIMARY KEY,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# Counter dimensions; "all" has a single row with the overall totals
+ALL = 'all'
+USER = 'user'
+LABEL = 'label'
+METHOD = 'method'
+
+
+def is_toxic_label(label):
+    """Mixed transcripts contain toxic lines, so they count as toxic on the dashboard"""
+    return label in ('toxic', 'mixed')
+
+
+def entry_keys(entry):
+    """The (dimension, key) counters one log entry contributes to"""
+    return [
+        (ALL, ''),
+        (USER, entry.get('user') or 'anonymous'),
+        (LABEL, entry.get('label') or 'unknown'),
+        (METHOD, entry.get('method') or 'unknown'),
+    ]
+
+
+class DashboardStats:
+    """Persisted, incrementally maintained aggregates of the analysis log"""
+
+    def __init__(self, path=DASHBOARD_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        # Batches arrive from the log writer, rebuilds from the main thread
+        self._write_lock = threading.Lock()
+        self._compacted_at = 0
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.executescript(rollups.SCHEMA)
+
+    def connection(self):
+        """Per-thread connection; WAL lets the dashboard read while batches are applied"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _state(self, name):
+        row = self.connection().execute('SELECT value FROM state WHERE name = ?', (name,)).fetchone()
+        return row['value'] if row else 0
+
+    def last_id(self):
+        """Id of the last log entry included in the counters"""
+        return self._state('last_id')
+
+    def apply(self, entries):
+        """Add a batch of log entries to the counters (the analysis log listener)"""
+        with self._write_lock:
+            last_id = self.last_id()
+            # A batch already counted before a restart is skipped entry by entry
+            entries = [entry for entry in entries if entry.get('id', 0) > last_id]
+            if entries:
+                self._apply(entries)
+            if time.monotonic() - self._compacted_at >= ROLLUP_COMPACT_SECONDS:
+                self._compact()
+
+    def _compact(self):
+        with self.connection() as conn:
+            rollups.compact(conn)
+        self._compacted_at = time.monotonic()
+
+    def _apply(self, entries):
+        deltas = {}
+        for entry in entries:
+            toxic = is_toxic_label(entry.get('label'))
+            score = float(entry.get('score') or 0)
+            for key in entry_keys(entry):
+                delta = deltas.setdefault(key, [0, 0, 0, 0.0])
+                delta[0] += 1
+                delta[1] += toxic
+                delta[2] += not toxic
+                delta[3] += score
+
+        with self.connection() as conn:
+            users = [key for dimension, key in deltas if dimension == USER]
+            known = {
+                row['key'] for row in conn.execute(
+                    f"SELECT key FROM counters WHERE dimension = ? AND key IN ({','.join('?' * len(users))})",
+                    [USER] + users
+                )
+            }
+            conn.execute(
+                "INSERT INTO state (name, value) VALUES ('unique_users', ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                (len(users) - len(known),)
+            )
+            conn.executemany(
+                'INSERT INTO counters (dimension, key, total, toxic, safe, score_sum) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (dimension, key) DO UPDATE SET total = total + excluded.total, '
+                'toxic = toxic + excluded.toxic, safe = safe + excluded.safe, score_sum = score_sum + excluded.score_sum',
+                [key + tuple(delta) for key, delta in deltas.items()]
+            )
+            rollups.add_entries(conn, entries, is_toxic_label)
+            recent = entries[-RECENT_ACTIVITY_LIMIT:]
+            conn.executemany(
+                'INSERT OR REPLACE INTO recent_activity (id, entry) VALUES (?, ?)',
+                [(entry.get('id', 0), json.dumps(entry, ensure_ascii=False)) for entry in recent]
+            )
+            conn.execute(
+                'DELETE FROM recent_activity WHERE id NOT IN '
+                '(SELECT id FROM recent_activity ORDER BY id DESC LIMIT ?)', (RECENT_ACTIVITY_LIMIT,)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO state (name, value) VALUES ('last_id', ?)",
+                (max(entry.get('id', 0) for entry in entries),)
+            )
+
+    def catch_up(self, log):
+        """Apply entries of an AnalysisLog the counters missed (e.g. written just before a crash)
+
+        Runs under the log's writer lock, so no other process's listener applies
+        a batch in between, and only reads the segments after the counters' last id.
+        """
+        with log.locked():
+            last_id = self.last_id()
+            if last_id >= log.last_id():
+                return 0
+            return self._apply_all(log.iter_entries(after_id=last_id))
+
+    def rebuild(self, entries):
+        """Recompute every counter from scratch from the raw log entries"""
+        with self._write_lock:
+            with self.connection() as conn:
+                conn.execute('DELETE FROM counters')
+                conn.execute('DELETE FROM recent_activity')
+                conn.execute('DELETE FROM state')
+                conn.execute('DELETE FROM rollups')
+                conn.execute('DELETE FROM rollup_watermarks')
+        count = self._apply_all(entries)
+        with self._write_lock:
+            self._compact()
+        return count
+
+    def _apply_all(self, entries):
+        count = 0
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= REBUILD_CHUNK:
+                self.apply(chunk)
+                count += len(chunk)
+                chunk = []
+        self.apply(chunk)
+        return count + len(chunk)
+
+    def _counter_rows(self, dimension):
+        return self.connection().execute(
+            'SELECT key, total, toxic, safe, score_sum FROM counters WHERE dimension = ?', (dimension,)
+        ).fetchall()
+
+    def timeseries(self, resolution, start=None, end=None):
+        """Analysis counts per minute, hour or day bucket (see rollups.query)"""
+        return rollups.query(self.connection(), resolution, start, end)
+
+    def snapshot(self, days=DAILY_STATS_DAYS, top_users=TOP_USERS_LIMIT, now=None):
+        """Everything the admin dashboard shows, read from the counters"""
+        conn = self.connection()
+        overall = conn.execute(
+            "SELECT total, toxic, safe, score_sum FROM counters WHERE dimension = ? AND key = ''", (ALL,)
+        ).fetchone()
+        total, toxic, safe, score_sum = tuple(overall) if overall else (0, 0, 0, 0.0)
+
+        unique_users = self._state('unique_users')
+        user_stats = [
+            {'user': row['key'], 'total': row['total'], 'toxic': row['toxic'], 'safe': row['safe']}
+            for row in conn.execute(
+                'SELECT key, total, toxic, safe FROM counters WHERE dimension = ? ORDER BY total DESC LIMIT ?',
+                (USER, top_users)
+            )
+        ]
+
+        now = now or datetime.now()
+        daily_stats = [
+            {'date': bucket['bucket'], 'total': bucket['total'], 'toxic': bucket['toxic'], 'safe': bucket['safe']}
+            for bucket in rollups.query(conn, rollups.DAY, now - timedelta(days=days - 1), now)
+        ]
+
+        recent_activity = [
+            json.loads(row['entry'])
+            for row in conn.execute('SELECT entry FROM recent_activity ORDER BY id DESC')
+        ]
+
+        return {
+            'total_analyses': total,
+            'total_messages': total,
+            'toxic_count': toxic,
+            'safe_count': safe,
+            'toxicity_rate': toxic / total * 100 if total else 0.0,
+            'avg_score': score_sum / total if total else 0.0,
+            'unique_users': unique_users,
+            'user_stats': user_stats,
+            'daily_stats': daily_stats,
+            'label_distribution': {row['key']: row['total'] for row in self._counter_rows(LABEL)},
+            'method_distribution': {row['key']: row['total'] for row in self._counter_rows(METHOD)},
+            'recent_activity': recent_activity
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the admin dashboard counters")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Recompute all counters from the analysis log (stop the app first)")
+    parser.add_argument('--compact', action='store_true',
+                        help="Compact minute rollups into hours and days and apply retention now")
+    parser.add_argument('--logs', default=ANALYSIS_LOG_DIR, help="Analysis log directory")
+    parser.add_argument('--db', default=DASHBOARD_DB_PATH, help="Dashboard counters database")
+    args = parser.parse_args()
+
+    stats = DashboardStats(args.db)
+    if args.rebuild:
+        count = stats.rebuild(iter_log_entries(args.logs))
+        print(f"✅ Rebuilt dashboard counters from {count} log entries")
+    elif args.compact:
+        with stats.connection() as conn:
+            rollups.compact(conn)
+        print("✅ Compacted rollups")
+
+    snapshot = stats.snapshot()
+    print(f"📊 {snapshot['total_analyses']} analyses, {snapshot['toxic_count']} toxic "
+          f"({snapshot['toxicity_rate']:.1f}%), {snapshot['unique_users']} users")
+
+
+if __name__ == "__main__":
+    main()
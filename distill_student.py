@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+SafeSpace.AI - Teacher/Student Distillation
+==========================================
+
+Distills Groq (teacher) verdicts into the local student classifier used by
+the app.py cascade.
+
+Steps:
+1. Collect LLM-labeled messages from the analysis log and batch-run CSVs
+2. Split into train / held-out sets (stratified, deterministic)
+3. Train the hashed n-gram student on CPU
+4. Evaluate agreement with the teacher, overall and at the cascade threshold
+5. Publish a versioned artifact (models/student/vN) and move the LATEST pointer
+
+Usage:
+    python distill_student.py
+    python distill_student.py --results "toxicity_test_results_*.csv" --min-agreement 0.95
+    python distill_student.py --dry-run --dataset-out distill_dataset.jsonl
+"""
+
+import os
+import csv
+import glob
+import json
+import random
+import argparse
+from datetime import datetime
+
+from student_model import StudentClassifier, STUDENT_MODEL_DIR, latest_version
+from analysis_log import iter_log_entries, ANALYSIS_LOG_DIR
+
+# Confidence the student needs before the cascade trusts it without calling the API
+STUDENT_CONFIDENCE = float(os.environ.get('STUDENT_CONFIDENCE', '0.9'))
+
+# Log methods whose labels came from the LLM teacher
+TEACHER_METHODS = ['groq', 'Groq API']
+# The log keeps the first LOGGED_MESSAGE_CHARS characters of a message followed by "..."
+LOGGED_MESSAGE_CHARS = 200
+TRUNCATION_MARKER = '...'
+
+
+def is_truncated(entry):
+    """Whether a log entry holds only the start of its message"""
+    message = entry['message']
+    if entry.get('message_length') is not None:
+        return entry['message_length'] > len(message)
+    # Entries logged before message_length was recorded
+    return len(message) == LOGGED_MESSAGE_CHARS + len(TRUNCATION_MARKER) and message.endswith(TRUNCATION_MARKER)
+
+
+def collect_from_logs(path, methods):
+    """Collect teacher-labeled messages from the analysis log (or an old analysis_logs.json)"""
+    if not os.path.exists(path):
+        return []
+    if os.path.isdir(path):
+        entries = iter_log_entries(path)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+
+    examples = []
+    for entry in entries:
+        # "mixed" entries are multi-line transcripts without a single message-level verdict, and
+        # truncated messages would teach the student on cut-off text with a fake "..." ending
+        if entry.get('method') in methods and entry.get('label') in ('toxic', 'safe') and not is_truncated(entry):
+            examples.append({'message': entry['message'], 'is_toxic': entry['label'] == 'toxic', 'source': path})
+    return examples
+
+
+def collect_from_results(pattern):
+    """Collect Groq verdicts from test_toxicity_batch.py result CSVs"""
+    examples = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                # Rows where the API call failed carry no teacher label
+                if row.get('groq_is_toxic') in ('True', 'False') and row.get('message'):
+                    examples.append({
+                        'message': row['message'],
+                        'is_toxic': row['groq_is_toxic'] == 'True',
+                        'source': path
+                    })
+    return examples
+
+
+def deduplicate(examples):
+    """Keep the most recent label for each distinct message"""
+    by_message = {}
+    for example in examples:
+        by_message[example['message'].strip().lower()] = example
+    return list(by_message.values())
+
+
+def split_dataset(examples, holdout_fraction, seed):
+    """Stratified train / held-out split"""
+    rng = random.Random(seed)
+    train, holdout = [], []
+    for label in (True, False):
+        group = [example for example in examples if example['is_toxic'] == label]
+        rng.shuffle(group)
+        cut = int(round(len(group) * holdout_fraction))
+        holdout.extend(group[:cut])
+        train.extend(group[cut:])
+    return train, holdout
+
+
+def evaluate(model, examples, confidence):
+    """Agreement with the teacher overall and on the messages the cascade would keep local"""
+    total = len(examples)
+    agree = 0
+    covered = 0
+    covered_agree = 0
+    true_positive = false_positive = false_negative = 0
+
+    for example in examples:
+        probability = model.predict_proba(example['message'])
+        predicted = probability >= 0.5
+        if predicted == example['is_toxic']:
+            agree += 1
+        if predicted and example['is_toxic']:
+            true_positive += 1
+        elif predicted:
+            false_positive += 1
+        elif example['is_toxic']:
+            false_negative += 1
+
+        if probability >= confidence or probability <= 1 - confidence:
+            covered += 1
+            if predicted == example['is_toxic']:
+                covered_agree += 1
+
+    return {
+        'examples': total,
+        'agreement': agree / total if total else 0.0,
+        'toxic_precision': true_positive / (true_positive + false_positive) if true_positive + false_positive else 0.0,
+        'toxic_recall': true_positive / (true_positive + false_negative) if true_positive + false_negative else 0.0,
+        'coverage': covered / total if total else 0.0,
+        'covered_agreement': covered_agree / covered if covered else 0.0,
+        'confidence_threshold': confidence
+    }
+
+
+def publish(model, model_dir):
+    """Write the model as the next version and point LATEST at it"""
+    current = latest_version(model_dir)
+    number = int(current[1:]) + 1 if current and current[1:].isdigit() else 1
+    version = f'v{number}'
+
+    version_dir = os.path.join(model_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+    model.metadata['version'] = version
+    model.save(os.path.join(version_dir, 'student.json'))
+
+    # Swap the pointer atomically so a running app never reads a half-written file
+    pointer_tmp = os.path.join(model_dir, 'LATEST.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(model_dir, 'LATEST'))
+    return version
+
+
+def print_metrics(title, metrics):
+    """Print evaluation metrics"""
+    print(f"\n📊 {title} ({metrics['examples']} messages)")
+    print(f"   Agreement with teacher: {metrics['agreement']:.1%}")
+    print(f"   Toxic precision / recall: {metrics['toxic_precision']:.1%} / {metrics['toxic_recall']:.1%}")
+    print(f"   Handled locally at {metrics['confidence_threshold']:.2f} confidence: {metrics['coverage']:.1%}"
+          f" (agreement {metrics['covered_agreement']:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill Groq verdicts into the local student classifier")
+    parser.add_argument('--logs', default=ANALYSIS_LOG_DIR,
+                        help="Analysis log directory (or a legacy analysis_logs.json) to collect labels from")
+    parser.add_argument('--log-methods', nargs='+', default=TEACHER_METHODS, help="Log methods labeled by the LLM")
+    parser.add_argument('--results', default='toxicity_test_results_*.csv', help="Glob of batch-run result CSVs")
+    parser.add_argument('--model-dir', default=STUDENT_MODEL_DIR)
+    parser.add_argument('--holdout', type=float, default=0.2, help="Fraction of messages held out for evaluation")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--confidence', type=float, default=STUDENT_CONFIDENCE)
+    parser.add_argument('--min-agreement', type=float, default=0.9,
+                        help="Minimum held-out agreement on locally handled messages required to publish")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dataset-out', help="Also write the collected dataset as JSON Lines")
+    parser.add_argument('--dry-run', action='store_true', help="Train and evaluate without publishing")
+    args = parser.parse_args()
+
+    print("🚀 SafeSpace.AI - Teacher/Student Distillation")
+    print("=" * 60)
+
+    examples = collect_from_logs(args.logs, args.log_methods) + collect_from_results(args.results)
+    examples = deduplicate(examples)
+    toxic = sum(1 for example in examples if example['is_toxic'])
+    print(f"📁 Collected {len(examples)} teacher-labeled messages ({toxic} toxic, {len(examples) - toxic} safe)")
+
+    if args.dataset_out:
+        with open(args.dataset_out, 'w', encoding='utf-8') as f:
+            for example in examples:
+                f.write(json.dumps(example, ensure_ascii=False) + '\n')
+        print(f"💾 Dataset written to {args.dataset_out}")
+
+    if toxic == 0 or toxic == len(examples):
+        print("❌ Need both toxic and safe examples to train a student")
+        return
+
+    train, holdout = split_dataset(examples, args.holdout, args.seed)
+    print(f"🧪 Training on {len(train)} messages, holding out {len(holdout)}")
+
+    model = StudentClassifier().fit(
+        [example['message'] for example in train],
+        [example['is_toxic'] for example in train],
+        epochs=args.epochs,
+        seed=args.seed
+    )
+
+    train_metrics = evaluate(model, train, args.confidence)
+    holdout_metrics = evaluate(model, holdout, args.confidence)
+    print_metrics("Training set", train_metrics)
+    print_metrics("Held-out set", holdout_metrics)
+
+    model.metadata.update({
+        'created_at': datetime.now().isoformat(),
+        'train_examples': len(train),
+        'holdout_examples': len(holdout),
+        'holdout_metrics': holdout_metrics,
+        'sources': sorted({example['source'] for example in examples})
+    })
+
+    if args.dry_run:
+        print("\n⚠️ Dry run - model not published")
+        return
+    if holdout_metrics['covered_agreement'] < args.min_agreement:
+        print(f"\n❌ Held-out agreement {holdout_metrics['covered_agreement']:.1%} is below "
+              f"{args.min_agreement:.1%} - model not published")
+        return
+
+    version = publish(model, args.model_dir)
+    print(f"\n✅ Published student model {version} to {args.model_dir}")
+    print("   app.py loads the latest version at startup")
+
+
+if __name__ == "__main__":
+    main()
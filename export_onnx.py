@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Export the toxic-bert model to ONNX for SafeSpace.AI
+Produces model.onnx (FP32) and, by default, model.quant.onnx (int8 dynamic
+quantization) together with the tokenizer and config, ready for onnx_backend.py.
+
+Usage:
+    python export_onnx.py
+    python export_onnx.py --output models/toxic-bert-onnx --no-quantize
+"""
+
+import os
+import argparse
+
+DEFAULT_MODEL = "unitary/toxic-bert"
+DEFAULT_OUTPUT = os.environ.get('ONNX_MODEL_DIR', 'models/toxic-bert-onnx')
+
+
+def export_model(model_name, output_dir, opset=14):
+    """Export the PyTorch model to an FP32 ONNX graph with dynamic batch/sequence axes"""
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"📥 Loading {model_name}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    # Tokenizer and config travel with the graph so the runtime needs no hub access
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    sample = tokenizer(["Hello team, great work today!"], return_tensors="pt")
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch'}
+
+    onnx_path = os.path.join(output_dir, 'model.onnx')
+    print(f"📦 Exporting ONNX graph (opset {opset})...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+
+    print(f"✅ FP32 model saved to {onnx_path} ({os.path.getsize(onnx_path) / 1e6:.1f} MB)")
+    return onnx_path
+
+
+def quantize_model(onnx_path, output_dir):
+    """Apply int8 dynamic quantization to the weights of the exported graph"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quant_path = os.path.join(output_dir, 'model.quant.onnx')
+    print("🗜️ Applying int8 dynamic quantization...")
+    quantize_dynamic(
+        onnx_path,
+        quant_path,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+
+    print(f"✅ Quantized model saved to {quant_path} ({os.path.getsize(quant_path) / 1e6:.1f} MB)")
+    return quant_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export toxic-bert to ONNX (optionally int8 quantized)")
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="Hugging Face model name or local path")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Output directory for the ONNX model")
+    parser.add_argument('--opset', type=int, default=14, help="ONNX opset version")
+    parser.add_argument('--no-quantize', action='store_true', help="Skip int8 dynamic quantization")
+    args = parser.parse_args()
+
+    print("🚀 SafeSpace.AI - ONNX Export")
+    print("=" * 60)
+
+    onnx_path = export_model(args.model, args.output, args.opset)
+    if not args.no_quantize:
+        quantize_model(onnx_path, args.output)
+
+    print("\n🎉 Export complete!")
+    print(f"   Run the Gradio app with: SAFESPACE_BACKEND=onnx ONNX_MODEL_DIR={args.output} python app_hf.py")
+    print("   Compare against PyTorch with: python benchmark_onnx.py")
+
+
+if __name__ == "__main__":
+    main()
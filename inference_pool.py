@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Multi-process inference pool for SafeSpace.AI
+Loads the toxicity model once per worker process and classifies large batches
+in parallel chunks, with a bounded number of chunks in flight for back-pressure.
+"""
+
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# 0 means one worker per CPU core
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', '0')) or (os.cpu_count() or 1)
+INFERENCE_CHUNK_SIZE = int(os.environ.get('INFERENCE_CHUNK_SIZE', '32'))
+# Batches smaller than this are cheaper to run in-process than to ship to workers
+INFERENCE_POOL_MIN_BATCH = int(os.environ.get('INFERENCE_POOL_MIN_BATCH', '64'))
+
+# Per-process model instance, set by the pool initializer
+_worker_model = None
+
+
+def _init_worker(threads):
+    """Load and warm up the model once in each worker process"""
+    global _worker_model
+    from toxicity_model import load_model, warm_up_model
+
+    _worker_model = load_model(threads=threads)
+    warm_up_model(_worker_model)
+
+
+def _classify_chunk(texts):
+    """Classify one chunk of texts inside a worker process"""
+    return _worker_model(list(texts))
+
+
+def _ping():
+    """No-op task used to make sure every worker has finished loading"""
+    return os.getpid()
+
+
+class InferencePool:
+    """Process pool that splits batches into chunks and classifies them in parallel"""
+
+    def __init__(self, workers=INFERENCE_WORKERS, chunk_size=INFERENCE_CHUNK_SIZE, max_in_flight=None):
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        # Two chunks per worker keeps every core busy without queueing the whole batch
+        self.max_in_flight = max_in_flight or self.workers * 2
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+
+        # spawn avoids forking a parent whose torch/ORT thread pools are already running
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(threads_per_worker,)
+        )
+
+    def warm_up(self):
+        """Block until every worker process has loaded its model"""
+        futures = [self.executor.submit(_ping) for _ in range(self.workers)]
+        return sorted({future.result() for future in futures})
+
+    def classify(self, texts):
+        """Classify texts in parallel chunks, returning predictions in input order"""
+        texts = list(texts)
+        results = []
+        in_flight = deque()
+
+        for start in range(0, len(texts), self.chunk_size):
+            # Back-pressure: wait for the oldest chunk before submitting more work
+            if len(in_flight) >= self.max_in_flight:
+                results.extend(in_flight.popleft().result())
+            in_flight.append(self.executor.submit(_classify_chunk, texts[start:start + self.chunk_size]))
+
+        while in_flight:
+            results.extend(in_flight.popleft().result())
+        return results
+
+    def shutdown(self):
+        """Stop all worker processes"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Background job queue for SafeSpace.AI bulk analyses
+Bulk uploads are stored as jobs in a local SQLite database and processed by a
+pool of background worker threads, so the web request returns immediately.
+Messages, progress and per-message results live in the database, which lets
+interrupted jobs resume after a restart without redoing finished messages.
+Small analyses run inside the request are stored here too (save_analysis), so
+every web worker can serve a user's exports. Finished jobs are deleted once
+they are older than JOB_RESULT_TTL_HOURS.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', 'data/jobs.db')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_MESSAGE_WORKERS = int(os.environ.get('JOB_MESSAGE_WORKERS', '8'))
+# Distinct message results remembered per job so later repeats are not analyzed again
+JOB_DEDUP_CACHE = 10000
+# Seconds an idle worker waits before checking the queue again
+JOB_POLL_SECONDS = 5
+# Completed results are written when this many are ready or this much time has passed
+JOB_FLUSH_SIZE = 16
+JOB_FLUSH_SECONDS = 0.25
+# Messages are inserted and committed in chunks of this size while an upload is parsed
+JOB_INGEST_CHUNK = 1000
+# How long a worker waits for more messages from an upload that is still being parsed
+JOB_INGEST_POLL_SECONDS = 0.2
+# A running job whose worker has not reported progress for this long is requeued
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '300'))
+# Finished jobs and their results are kept this long for viewing and exports
+JOB_RESULT_TTL_HOURS = float(os.environ.get('JOB_RESULT_TTL_HOURS', '24'))
+# How often an idle worker deletes expired jobs
+JOB_PURGE_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    toxic_count INTEGER NOT NULL DEFAULT 0,
+    rewrites_count INTEGER NOT NULL DEFAULT 0,
+    removed_count INTEGER NOT NULL DEFAULT 0,
+    ingesting INTEGER NOT NULL DEFAULT 0,
+    priority TEXT NOT NULL DEFAULT 'bulk',
+    owner TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    heartbeat_at TEXT,
+    finished_at TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS job_messages (
+    job_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    user TEXT,
+    timestamp TEXT,
+    context_action TEXT,
+    context_reason TEXT,
+    PRIMARY KEY (job_id, message_id)
+);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, message_id)
+);
+"""
+
+# Columns added after the first release, applied to older databases on startup
+MIGRATIONS = [
+    ('jobs', 'ingesting', 'INTEGER NOT NULL DEFAULT 0'),
+    ('jobs', 'priority', "TEXT NOT NULL DEFAULT 'bulk'"),
+    ('job_messages', 'context_action', 'TEXT'),
+    ('job_messages', 'context_reason', 'TEXT'),
+    ('jobs', 'owner', 'TEXT'),
+]
+
+
+class JobStore:
+    """SQLite-backed storage for jobs, their input messages and their results"""
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._claim_lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+
+    def _migrate(self, conn):
+        """Add columns introduced after a database was first created"""
+        for table, name, definition in MIGRATIONS:
+            existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+    def connection(self):
+        """Per-thread connection; WAL lets readers run while workers write"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create_job(self, filename=None, priority='bulk', owner=None):
+        """Create a queued job that is still receiving messages, returning the job id
+
+        Workers may start on the job straight away; add_messages() feeds it and
+        finish_ingest() marks the input as complete. The priority class ("bulk" or
+        "backfill") is passed to process_message for the job's upstream calls. The
+        owner is an opaque token for the session that submitted the job.
+        """
+        job_id = uuid.uuid4().hex
+        with self.connection() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, filename, ingesting, priority, owner, created_at) VALUES (?, ?, ?, 1, ?, ?, ?)',
+                (job_id, 'queued', filename, priority, owner, datetime.now().isoformat())
+            )
+        return job_id
+
+    def add_messages(self, job_id, messages, chunk_size=JOB_INGEST_CHUNK):
+        """Append messages from any iterable, committing each chunk so workers can start on it"""
+        count = 0
+        chunk = []
+        for message in messages:
+            count += 1
+            chunk.append((job_id, count, message['message'], message.get('user'), message.get('timestamp'),
+                          message.get('context_action'), message.get('context_reason')))
+            if len(chunk) >= chunk_size:
+                self._insert_messages(job_id, chunk)
+                chunk = []
+        self._insert_messages(job_id, chunk)
+        return count
+
+    def _insert_messages(self, job_id, rows):
+        if not rows:
+            return
+        with self.connection() as conn:
+            conn.executemany(
+                """INSERT INTO job_messages (job_id, message_id, message, user, timestamp, context_action, context_reason)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                rows
+            )
+            conn.execute(
+                'UPDATE jobs SET total = total + ?, heartbeat_at = ? WHERE id = ?',
+                (len(rows), datetime.now().isoformat(), job_id)
+            )
+
+    def finish_ingest(self, job_id):
+        """Mark a job's input as complete"""
+        with self.connection() as conn:
+            conn.execute('UPDATE jobs SET ingesting = 0 WHERE id = ?', (job_id,))
+
+    def is_ingesting(self, job_id):
+        """Whether messages are still being added to a job"""
+        row = self.connection().execute('SELECT ingesting FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row['ingesting'])
+
+    def claim_next_job(self):
+        """Atomically move the oldest queued job to running and return its id
+
+        Backfill jobs are only claimed when no bulk job is waiting.
+        """
+        with self._claim_lock, self.connection() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority = 'backfill', created_at LIMIT 1"
+            ).fetchone()
+            if not row:
+                return None
+            # The status check guards against another process claiming it first
+            now = datetime.now().isoformat()
+            claimed = conn.execute(
+                """UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), heartbeat_at = ?
+                   WHERE id = ? AND status = 'queued'""",
+                (now, now, row['id'])
+            ).rowcount
+            return row['id'] if claimed else None
+
+    def is_stale(self, job_id, stale_seconds=JOB_STALE_SECONDS):
+        """Whether a job has had no new messages or results for stale_seconds"""
+        row = self.connection().execute('SELECT heartbeat_at FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - stale_seconds).isoformat()
+        return bool(row and row['heartbeat_at'] and row['heartbeat_at'] < cutoff)
+
+    def requeue_interrupted(self, stale_seconds=JOB_STALE_SECONDS):
+        """Put running jobs whose worker stopped reporting progress back on the queue"""
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - stale_seconds).isoformat()
+        with self.connection() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?",
+                (cutoff,)
+            ).rowcount
+
+    def pending_messages(self, job_id, page_size=500):
+        """Messages of a job that do not have a result yet, in message order"""
+        last_id = 0
+        while True:
+            # Keyset pages keep no cursor open while the worker writes results
+            rows = self.connection().execute(
+                '''SELECT m.message_id, m.message, m.user, m.timestamp, m.context_action, m.context_reason
+                   FROM job_messages m
+                   LEFT JOIN job_results r ON r.job_id = m.job_id AND r.message_id = m.message_id
+                   WHERE m.job_id = ? AND m.message_id > ? AND r.message_id IS NULL
+                   ORDER BY m.message_id LIMIT ?''',
+                (job_id, last_id, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_id = rows[-1]['message_id']
+
+    def save_results(self, job_id, results):
+        """Store a batch of per-message results and advance the job's counters"""
+        if not results:
+            return
+        with self.connection() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO job_results (job_id, message_id, result) VALUES (?, ?, ?)',
+                ((job_id, r['message_id'], json.dumps(r, ensure_ascii=False)) for r in results)
+            )
+            conn.execute(
+                '''UPDATE jobs SET processed = processed + ?, toxic_count = toxic_count + ?,
+                   rewrites_count = rewrites_count + ?, removed_count = removed_count + ?,
+                   heartbeat_at = ? WHERE id = ?''',
+                (
+                    len(results),
+                    sum(1 for r in results if r.get('is_toxic')),
+                    sum(1 for r in results if r.get('is_toxic') and r.get('rewrite')),
+                    sum(1 for r in results if r.get('rewrite_type') == 'remove'),
+                    datetime.now().isoformat(),
+                    job_id
+                )
+            )
+
+    def save_analysis(self, results, filename=None, owner=None):
+        """Store the results of an analysis that already ran as a completed job, returning its id"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            # Inserted as completed so no worker ever claims it
+            conn.execute(
+                """INSERT INTO jobs (id, status, filename, total, owner, created_at, started_at, finished_at)
+                   VALUES (?, 'completed', ?, ?, ?, ?, ?, ?)""",
+                (job_id, filename, len(results), owner, now, now, now)
+            )
+        self.save_results(job_id, results)
+        return job_id
+
+    def purge_expired(self, ttl_hours=JOB_RESULT_TTL_HOURS):
+        """Delete finished jobs older than the TTL with their messages and results"""
+        cutoff = datetime.fromtimestamp(datetime.now().timestamp() - ttl_hours * 3600).isoformat()
+        with self.connection() as conn:
+            expired = [row['id'] for row in conn.execute('SELECT id FROM jobs WHERE finished_at < ?', (cutoff,))]
+            for job_id in expired:
+                conn.execute('DELETE FROM job_messages WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM job_results WHERE job_id = ?', (job_id,))
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        return len(expired)
+
+    def finish_job(self, job_id, status='completed', error=None):
+        """Mark a job as completed or failed"""
+        with self.connection() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?',
+                (status, datetime.now().isoformat(), error, job_id)
+            )
+
+    def get_job(self, job_id):
+        """Job status and progress counters, or None for an unknown job"""
+        row = self.connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job['progress'] = round(job['processed'] / job['total'] * 100, 1) if job['total'] else 100.0
+        return job
+
+    def get_results(self, job_id, page=1, per_page=100):
+        """One page of results in message order"""
+        rows = self.connection().execute(
+            'SELECT result FROM job_results WHERE job_id = ? ORDER BY message_id LIMIT ? OFFSET ?',
+            (job_id, per_page, (page - 1) * per_page)
+        )
+        return [json.loads(row['result']) for row in rows]
+
+    def iter_results(self, job_id, page_size=1000):
+        """Every result of a job in message order, read lazily in keyset pages"""
+        last_id = 0
+        while True:
+            rows = self.connection().execute(
+                'SELECT message_id, result FROM job_results WHERE job_id = ? AND message_id > ? ORDER BY message_id LIMIT ?',
+                (job_id, last_id, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield json.loads(row['result'])
+            last_id = rows[-1]['message_id']
+
+    def get_results_since(self, job_id, after=0, limit=500):
+        """Results saved after the given cursor, as (cursor, result) pairs in save order
+
+        The cursor is the row's insertion order, so streaming clients see each
+        result as soon as it is saved even though messages finish out of order.
+        """
+        rows = self.connection().execute(
+            'SELECT rowid, result FROM job_results WHERE job_id = ? AND rowid > ? ORDER BY rowid LIMIT ?',
+            (job_id, after, limit)
+        )
+        return [(row['rowid'], json.loads(row['result'])) for row in rows]
+
+    def count_results_until(self, job_id, cursor, limit):
+        """How many results were saved up to a get_results_since cursor, counting at most limit"""
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM job_results WHERE job_id = ? AND rowid <= ? LIMIT ?)',
+            (job_id, cursor, limit)
+        ).fetchone()[0]
+
+
+class JobWorkerPool:
+    """Background threads that claim queued jobs and process their messages
+
+    Messages with the same message_key are analyzed once per job and fan_out
+    copies the result to every repeat with that message's own id, user and
+    timestamp. fan_out may return None when a remembered result cannot serve a
+    repeat (e.g. it was analyzed without the rewrite this repeat needs), in which
+    case the repeat is analyzed again. on_results(job_id, results) is called after
+    each batch of results is saved.
+    """
+
+    def __init__(self, store, process_message, message_key=None, fan_out=None, on_results=None,
+                 workers=JOB_WORKERS, message_workers=JOB_MESSAGE_WORKERS):
+        self.store = store
+        self.process_message = process_message
+        self.message_key = message_key or (lambda text: text)
+        self.fan_out = fan_out or (lambda result, message: {**result, **message})
+        self.on_results = on_results
+        self.workers = workers
+        self.message_workers = message_workers
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._purged_at = 0
+        self._purge_lock = threading.Lock()
+
+    def start(self):
+        """Resume interrupted jobs and start the worker threads"""
+        resumed = self.store.requeue_interrupted()
+        if resumed:
+            print(f"🔁 Resuming {resumed} interrupted analysis jobs")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after a job has been submitted"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            job_id = self.store.claim_next_job()
+            if not job_id:
+                # Pick up jobs orphaned by a worker process that died mid-run
+                self.store.requeue_interrupted()
+                self._purge()
+                self._wakeup.wait(JOB_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            self._process_job(job_id)
+
+    def _purge(self):
+        """Delete expired jobs, at most once per JOB_PURGE_SECONDS across the pool"""
+        with self._purge_lock:
+            if time.monotonic() - self._purged_at < JOB_PURGE_SECONDS:
+                return
+            self._purged_at = time.monotonic()
+        purged = self.store.purge_expired()
+        if purged:
+            print(f"🧹 Deleted {purged} expired analysis jobs")
+
+    def _process_job(self, job_id):
+        print(f"⚙️ Processing analysis job {job_id}")
+        priority = self.store.get_job(job_id)['priority']
+        known = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.message_workers) as executor:
+                while True:
+                    # Checked before the scan: once ingestion had finished, this scan sees every message
+                    ingesting = self.store.is_ingesting(job_id)
+                    processed = self._process_pending(job_id, executor, known, priority)
+                    if not ingesting:
+                        break
+                    if not processed:
+                        if self.store.is_stale(job_id):
+                            raise RuntimeError("Upload was interrupted before all messages were received")
+                        time.sleep(JOB_INGEST_POLL_SECONDS)
+            self.store.finish_job(job_id, 'completed')
+            print(f"✅ Analysis job {job_id} completed")
+        except Exception as e:
+            print(f"❌ Analysis job {job_id} failed: {e}")
+            self.store.finish_job(job_id, 'failed', str(e))
+
+    def _process_pending(self, job_id, executor, known, priority):
+        """Analyze every message that has no result yet, returning how many were processed"""
+        count = 0
+        batch = []
+        for message in self.store.pending_messages(job_id):
+            batch.append(message)
+            # Work through the job a few rounds of messages at a time so
+            # memory stays bounded however large the job is
+            if len(batch) >= self.message_workers * 4:
+                self._process_batch(job_id, executor, batch, known, priority)
+                count += len(batch)
+                batch = []
+        self._process_batch(job_id, executor, batch, known, priority)
+        return count + len(batch)
+
+    def _process_batch(self, job_id, executor, batch, known, priority):
+        """Analyze a batch, saving results as they complete so streams see them quickly"""
+        # Repeats of an earlier message reuse its result; repeats within the batch share one call
+        completed = []
+        groups = {}
+        for message in batch:
+            key = self.message_key(message['message'])
+            reused = self.fan_out(known[key], message) if key in known else None
+            if reused:
+                completed.append(reused)
+            else:
+                groups.setdefault(key, []).append(message)
+
+        # A repeat that needs a rewrite is analyzed on behalf of the group, so every repeat can use it
+        futures = {
+            executor.submit(self.process_message, next(
+                (message for message in group if message.get('context_action') == 'rewrite'), group[0]
+            ), priority): key
+            for key, group in groups.items()
+        }
+        last_flush = time.monotonic()
+        for future in as_completed(futures):
+            key = futures[future]
+            result = future.result()
+            if len(known) < JOB_DEDUP_CACHE:
+                known[key] = result
+            completed.extend(self.fan_out(result, message) for message in groups[key])
+            if len(completed) >= JOB_FLUSH_SIZE or time.monotonic() - last_flush >= JOB_FLUSH_SECONDS:
+                self._save(job_id, completed)
+                completed = []
+                last_flush = time.monotonic()
+        self._save(job_id, completed)
+
+    def _save(self, job_id, results):
+        if not results:
+            return
+        self.store.save_results(job_id, results)
+        if self.on_results:
+            self.on_results(job_id, results)
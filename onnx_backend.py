@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime backend for SafeSpace.AI
+Runs the exported (optionally int8-quantized) toxic-bert model on CPU with
+tuned thread settings. Produced by export_onnx.py, used by app_hf.py when
+SAFESPACE_BACKEND=onnx.
+"""
+
+import os
+import json
+
+import numpy as np
+
+# Defaults for the exported model location and runtime tuning
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', 'models/toxic-bert-onnx')
+ONNX_MODEL_FILE = os.environ.get('ONNX_MODEL_FILE', 'model.quant.onnx')
+ONNX_INTRA_OP_THREADS = int(os.environ.get('ONNX_INTRA_OP_THREADS', '0'))
+ONNX_INTER_OP_THREADS = int(os.environ.get('ONNX_INTER_OP_THREADS', '1'))
+ONNX_MAX_LENGTH = int(os.environ.get('ONNX_MAX_LENGTH', '512'))
+
+
+def create_session_options(intra_op_threads=None, inter_op_threads=None):
+    """Build ONNX Runtime session options tuned for CPU-only hosts"""
+    import onnxruntime as ort
+
+    intra = ONNX_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    inter = ONNX_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # A single BERT graph has no useful branch parallelism, so run operators
+    # sequentially and spend the cores inside each operator instead
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra  # 0 lets ORT use all physical cores
+    options.inter_op_num_threads = inter
+    # Keep idle worker threads from spinning and burning CPU between requests
+    options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+    return options
+
+
+class ONNXToxicityClassifier:
+    """Drop-in replacement for the transformers text-classification pipeline"""
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, model_file=ONNX_MODEL_FILE,
+                 intra_op_threads=None, inter_op_threads=None, max_length=ONNX_MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            # Fall back to the full-precision export if no quantized model exists
+            fallback_path = os.path.join(model_dir, 'model.onnx')
+            if not os.path.exists(fallback_path):
+                raise FileNotFoundError(f"No ONNX model found in {model_dir} - run export_onnx.py first")
+            model_path = fallback_path
+
+        self.model_path = model_path
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=create_session_options(intra_op_threads, inter_op_threads),
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        with open(os.path.join(model_dir, 'config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.id2label = {int(k): v for k, v in config.get('id2label', {}).items()}
+        # toxic-bert is a multi-label model, so scores are independent sigmoids
+        self.multi_label = config.get('problem_type') == 'multi_label_classification' or len(self.id2label) > 2
+
+    def predict_scores(self, texts):
+        """Return the raw per-label probability matrix for a batch of texts"""
+        encoded = self.tokenizer(
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors='np'
+        )
+        feeds = {name: encoded[name].astype(np.int64) for name in encoded if name in self.input_names}
+        logits = self.session.run(None, feeds)[0]
+
+        if self.multi_label:
+            return 1.0 / (1.0 + np.exp(-logits))
+        shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return shifted / shifted.sum(axis=-1, keepdims=True)
+
+    def __call__(self, texts, batch_size=32):
+        """Classify one text or a list of texts, returning pipeline-style dicts"""
+        batch = [texts] if isinstance(texts, str) else list(texts)
+
+        results = []
+        for start in range(0, len(batch), batch_size):
+            scores = self.predict_scores(batch[start:start + batch_size])
+            for row in scores:
+                best = int(row.argmax())
+                results.append({
+                    'label': self.id2label.get(best, str(best)),
+                    'score': float(row[best])
+                })
+        return results
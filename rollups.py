@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Time-series rollups for SafeSpace.AI
+Analysis counts are recorded in minute buckets, then compacted into hour and day
+buckets once those periods have closed. Each resolution has its own retention,
+so minute detail is available for recent incidents while years of history stay
+a few thousand day rows.
+
+Buckets are keyed by prefixes of the log's local ISO timestamps
+("2026-10-19T14:05", "2026-10-19T14", "2026-10-19"), so a bucket's parent is a
+plain substring and range queries are index range scans. Watermarks record the
+first period of each coarse resolution that has not been compacted yet; a query
+combines compacted buckets before the watermark with finer buckets after it, so
+results include the current hour and day.
+
+The functions here take the caller's SQLite connection, so rollups are updated in
+the same transaction as the dashboard counters (see dashboard_stats.py).
+"""
+
+import os
+from datetime import datetime, timedelta
+
+MINUTE = 'minute'
+HOUR = 'hour'
+DAY = 'day'
+
+# Length of each resolution's bucket key and bucket width
+KEY_LENGTHS = {MINUTE: 16, HOUR: 13, DAY: 10}
+KEY_FORMATS = {MINUTE: '%Y-%m-%dT%H:%M', HOUR: '%Y-%m-%dT%H', DAY: '%Y-%m-%d'}
+STEPS = {MINUTE: timedelta(minutes=1), HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+# The finer resolution each coarse one is compacted from
+COMPACTED_FROM = {HOUR: MINUTE, DAY: HOUR}
+
+# Days each resolution is kept (0 = forever)
+ROLLUP_RETENTION_DAYS = {
+    MINUTE: int(os.environ.get('ROLLUP_MINUTE_RETENTION_DAYS', '2')),
+    HOUR: int(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', '90')),
+    DAY: int(os.environ.get('ROLLUP_DAY_RETENTION_DAYS', '0')),
+}
+# Most buckets a single query may return
+ROLLUP_MAX_POINTS = 5000
+# Default span of a query when no start is given
+DEFAULT_SPANS = {MINUTE: timedelta(hours=1), HOUR: timedelta(days=2), DAY: timedelta(days=30)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    toxic INTEGER NOT NULL DEFAULT 0,
+    safe INTEGER NOT NULL DEFAULT 0,
+    score_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (resolution, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    resolution TEXT PRIMARY KEY,
+    bucket TEXT NOT NULL
+);
+"""
+
+UPSERT = (
+    'INSERT INTO rollups (resolution, bucket, total, toxic, safe, score_sum) VALUES (?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (resolution, bucket) DO UPDATE SET total = total + excluded.total, '
+    'toxic = toxic + excluded.toxic, safe = safe + excluded.safe, score_sum = score_sum + excluded.score_sum'
+)
+
+
+def bucket_key(timestamp, resolution):
+    """The bucket an ISO timestamp (string or datetime) falls into"""
+    if isinstance(timestamp, datetime):
+        return timestamp.strftime(KEY_FORMATS[resolution])
+    return timestamp[:KEY_LENGTHS[resolution]]
+
+
+def watermarks(conn):
+    """First uncompacted bucket of each coarse resolution ('' before the first compaction)"""
+    marks = {resolution: '' for resolution in COMPACTED_FROM}
+    marks.update(
+        (row[0], row[1]) for row in conn.execute('SELECT resolution, bucket FROM rollup_watermarks')
+    )
+    return marks
+
+
+def add_entries(conn, entries, is_toxic):
+    """Count log entries into minute buckets
+
+    An entry older than a watermark (a late write or a catch-up after downtime)
+    is also added to the coarse buckets that were already compacted past it.
+    """
+    marks = watermarks(conn)
+    deltas = {}
+    for entry in entries:
+        timestamp = entry.get('timestamp')
+        if not timestamp:
+            continue
+        toxic = is_toxic(entry.get('label'))
+        score = float(entry.get('score') or 0)
+        minute = bucket_key(timestamp, MINUTE)
+        keys = [(MINUTE, minute)]
+        if minute < marks[HOUR]:
+            keys.append((HOUR, bucket_key(timestamp, HOUR)))
+        if minute < marks[DAY]:
+            keys.append((DAY, bucket_key(timestamp, DAY)))
+        for key in keys:
+            delta = deltas.setdefault(key, [0, 0, 0, 0.0])
+            delta[0] += 1
+            delta[1] += toxic
+            delta[2] += not toxic
+            delta[3] += score
+    conn.executemany(UPSERT, [key + tuple(delta) for key, delta in deltas.items()])
+
+
+def compact(conn, now=None, retention=ROLLUP_RETENTION_DAYS):
+    """Roll closed minutes into hours and closed hours into days, then apply retention"""
+    now = now or datetime.now()
+    marks = watermarks(conn)
+    for resolution in (HOUR, DAY):
+        source = COMPACTED_FROM[resolution]
+        closed = bucket_key(now, resolution)
+        if closed <= marks[resolution]:
+            continue
+        conn.execute(
+            'INSERT INTO rollups (resolution, bucket, total, toxic, safe, score_sum) '
+            f'SELECT ?, substr(bucket, 1, {KEY_LENGTHS[resolution]}), SUM(total), SUM(toxic), SUM(safe), SUM(score_sum) '
+            'FROM rollups WHERE resolution = ? AND bucket >= ? AND bucket < ? GROUP BY 2 '
+            'ON CONFLICT (resolution, bucket) DO UPDATE SET total = total + excluded.total, '
+            'toxic = toxic + excluded.toxic, safe = safe + excluded.safe, score_sum = score_sum + excluded.score_sum',
+            (resolution, source, marks[resolution], closed)
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO rollup_watermarks (resolution, bucket) VALUES (?, ?)', (resolution, closed)
+        )
+        marks[resolution] = closed
+
+    for resolution, days in retention.items():
+        if days <= 0:
+            continue
+        cutoff = bucket_key(now - timedelta(days=days), resolution)
+        # Fine buckets are only dropped once they have been compacted
+        parent = next((coarse for coarse, fine in COMPACTED_FROM.items() if fine == resolution), None)
+        if parent:
+            cutoff = min(cutoff, marks[parent])
+        conn.execute('DELETE FROM rollups WHERE resolution = ? AND bucket < ?', (resolution, cutoff))
+
+
+def parse_time(value):
+    """A naive local datetime from an ISO string (bucket keys like "2026-10-19T14" included)
+
+    Times with a UTC offset are converted to local time, which is what bucket keys use.
+    """
+    if len(value) == KEY_LENGTHS[HOUR]:
+        value += ':00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def auto_resolution(start, end):
+    """Finest resolution that keeps a chart to a few hundred points"""
+    span = end - start
+    if span <= timedelta(hours=6):
+        return MINUTE
+    if span <= timedelta(days=14):
+        return HOUR
+    return DAY
+
+
+def query(conn, resolution, start=None, end=None, fill=True):
+    """Buckets of one resolution between start and end (datetimes, both inclusive)
+
+    Periods not compacted yet are summed from the finer buckets on the fly.
+    """
+    end = end or datetime.now()
+    start = start or end - DEFAULT_SPANS[resolution]
+    first, last = bucket_key(start, resolution), bucket_key(end, resolution)
+    length = KEY_LENGTHS[resolution]
+    if (end - start) / STEPS[resolution] > ROLLUP_MAX_POINTS:
+        raise ValueError(f"Range spans more than {ROLLUP_MAX_POINTS} {resolution} buckets")
+
+    marks = watermarks(conn)
+    # (resolution, from, to) sources: compacted buckets up to the watermark, then
+    # each finer resolution for the periods its coarser neighbour has not compacted
+    sources = [(resolution, '', marks.get(resolution) or None)]
+    finer = COMPACTED_FROM.get(resolution)
+    lower = marks.get(resolution, '')
+    while finer:
+        upper = marks.get(finer) or None
+        sources.append((finer, lower, upper))
+        lower = upper or lower
+        finer = COMPACTED_FROM.get(finer)
+    parts = []
+    params = []
+    for source, lower, upper in sources:
+        parts.append(
+            f'SELECT substr(bucket, 1, {length}) AS key, total, toxic, safe, score_sum FROM rollups '
+            'WHERE resolution = ? AND bucket >= ? AND bucket < ?'
+        )
+        # The last bound is exclusive, so extend it past every finer key under `last`
+        params += [source, max(first, lower), min(last + '~', upper or '~')]
+
+    rows = conn.execute(
+        'SELECT key, SUM(total), SUM(toxic), SUM(safe), SUM(score_sum) FROM (' + ' UNION ALL '.join(parts) + ') '
+        'GROUP BY key ORDER BY key', params
+    ).fetchall()
+    buckets = {
+        row[0]: {
+            'bucket': row[0], 'total': row[1], 'toxic': row[2], 'safe': row[3],
+            'avg_score': row[4] / row[1] if row[1] else 0.0
+        }
+        for row in rows
+    }
+    if not fill:
+        return list(buckets.values())
+
+    series = []
+    current = parse_time(first)
+    while True:
+        key = bucket_key(current, resolution)
+        if key > last:
+            break
+        series.append(buckets.get(key) or {'bucket': key, 'total': 0, 'toxic': 0, 'safe': 0, 'avg_score': 0.0})
+        current += STEPS[resolution]
+    return series
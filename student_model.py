@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Local student classifier for SafeSpace.AI
+A small hashed n-gram logistic regression distilled from Groq verdicts by
+distill_student.py. Pure Python so the lightweight Flask app can run it
+without extra dependencies; app.py uses it as the first stage of the cascade
+and only calls the API for messages the student is unsure about.
+"""
+
+import os
+import re
+import json
+import math
+import zlib
+
+STUDENT_MODEL_DIR = os.environ.get('STUDENT_MODEL_DIR', 'models/student')
+STUDENT_N_FEATURES = 2 ** 18
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def extract_features(text, n_features=STUDENT_N_FEATURES):
+    """Hash word unigrams/bigrams and character trigrams into a sparse feature dict"""
+    text = text.lower()
+    words = TOKEN_PATTERN.findall(text)
+
+    grams = ['w:' + word for word in words]
+    grams += ['b:' + first + ' ' + second for first, second in zip(words, words[1:])]
+    # Character trigrams inside words catch obfuscated spellings ("id1ot", "stoopid")
+    for word in words:
+        padded = f' {word} '
+        grams += ['c:' + padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    features = {}
+    for gram in grams:
+        # crc32 is stable across processes, unlike the salted built-in hash()
+        index = zlib.crc32(gram.encode('utf-8')) % n_features
+        features[index] = features.get(index, 0.0) + 1.0
+
+    # L2-normalise so long messages do not dominate the logit
+    norm = math.sqrt(sum(value * value for value in features.values())) or 1.0
+    return {index: value / norm for index, value in features.items()}
+
+
+def sigmoid(value):
+    """Numerically safe logistic function"""
+    if value >= 0:
+        return 1.0 / (1.0 + math.exp(-value))
+    exp_value = math.exp(value)
+    return exp_value / (1.0 + exp_value)
+
+
+class StudentClassifier:
+    """Hashed-feature logistic regression trained on LLM-labeled messages"""
+
+    def __init__(self, weights=None, bias=0.0, n_features=STUDENT_N_FEATURES, metadata=None):
+        self.weights = weights or {}
+        self.bias = bias
+        self.n_features = n_features
+        self.metadata = metadata or {}
+
+    def predict_proba(self, text):
+        """Probability that a message is toxic"""
+        features = extract_features(text, self.n_features)
+        logit = self.bias + sum(self.weights.get(index, 0.0) * value for index, value in features.items())
+        return sigmoid(logit)
+
+    def fit(self, texts, labels, epochs=10, learning_rate=0.5, l2=1e-5, seed=42):
+        """Train with SGD on binary labels (True = toxic), balancing the two classes"""
+        import random
+
+        rows = [(extract_features(text, self.n_features), 1.0 if label else 0.0) for text, label in zip(texts, labels)]
+        positives = sum(1 for _, label in rows if label) or 1
+        negatives = (len(rows) - positives) or 1
+        class_weight = {1.0: len(rows) / (2 * positives), 0.0: len(rows) / (2 * negatives)}
+
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(rows)
+            rate = learning_rate / (1 + epoch)
+            for features, label in rows:
+                logit = self.bias + sum(self.weights.get(index, 0.0) * value for index, value in features.items())
+                gradient = (sigmoid(logit) - label) * class_weight[label]
+                for index, value in features.items():
+                    weight = self.weights.get(index, 0.0)
+                    self.weights[index] = weight - rate * (gradient * value + l2 * weight)
+                self.bias -= rate * gradient
+
+        # Drop weights that ended up negligible to keep the artifact small
+        self.weights = {index: weight for index, weight in self.weights.items() if abs(weight) > 1e-6}
+        return self
+
+    def save(self, path):
+        """Write the model as a JSON artifact"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'n_features': self.n_features,
+                'bias': self.bias,
+                'weights': {str(index): round(weight, 6) for index, weight in self.weights.items()},
+                'metadata': self.metadata
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read a model written by save()"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(
+            weights={int(index): weight for index, weight in data['weights'].items()},
+            bias=data['bias'],
+            n_features=data['n_features'],
+            metadata=data.get('metadata', {})
+        )
+
+
+def latest_version(model_dir=STUDENT_MODEL_DIR):
+    """Return the version name recorded in the LATEST pointer, or None"""
+    pointer = os.path.join(model_dir, 'LATEST')
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, 'r', encoding='utf-8') as f:
+        return f.read().strip() or None
+
+
+def load_student(model_dir=STUDENT_MODEL_DIR, version=None):
+    """Load a published student model (the latest one by default), or None if none exists"""
+    version = version or latest_version(model_dir)
+    if not version:
+        return None
+    path = os.path.join(model_dir, version, 'student.json')
+    if not os.path.exists(path):
+        return None
+    return StudentClassifier.load(path)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test analysis index time ranges with UTC offsets
+Logged timestamps are naive local time; ?start= and ?end= bounds with an
+offset or a Z suffix must select the same entries as the equivalent local
+bounds.
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta, timezone
+
+from analysis_index import AnalysisIndex
+
+
+def build_index():
+    """An index with one entry per hour of 2026-09-30, local time"""
+    path = os.path.join(tempfile.mkdtemp(), 'analysis_index.db')
+    index = AnalysisIndex(path)
+    day = datetime(2026, 9, 30)
+    index.add([
+        {'id': hour + 1, 'timestamp': (day + timedelta(hours=hour)).isoformat(), 'user': 'bob@company.com',
+         'label': 'toxic', 'method': 'groq', 'message': f'message {hour}'}
+        for hour in range(24)
+    ])
+    return index
+
+
+def ids(entries):
+    return sorted(entry['id'] for entry in entries)
+
+
+def test_offset_range_matches_local_range():
+    """The same instants as aware bounds and as local bounds return the same entries"""
+    index = build_index()
+    local_start, local_end = datetime(2026, 9, 30, 6), datetime(2026, 9, 30, 12)
+    aware_start = local_start.astimezone().astimezone(timezone.utc)
+    aware_end = local_end.astimezone().astimezone(timezone(timedelta(hours=5, minutes=30)))
+
+    expected, _ = index.query(start=local_start.isoformat(), end=local_end.isoformat(), limit=100)
+    with_offsets, _ = index.query(start=aware_start.isoformat(), end=aware_end.isoformat(), limit=100)
+    with_z, _ = index.query(start=aware_start.strftime('%Y-%m-%dT%H:%M:%SZ'), end=aware_end.isoformat(), limit=100)
+
+    print(f"local: {ids(expected)}, offsets: {ids(with_offsets)}, Z: {ids(with_z)}")
+    assert ids(expected) == list(range(7, 14))
+    assert ids(with_offsets) == ids(expected)
+    assert ids(with_z) == ids(expected)
+
+
+def test_date_prefix_end_covers_the_day():
+    """end="2026-09-30" still includes every entry of that day"""
+    index = build_index()
+    entries, _ = index.query(start='2026-09-30', end='2026-09-30', limit=100)
+    assert len(entries) == 24
+
+
+if __name__ == "__main__":
+    print("🧪 TESTING ANALYSIS INDEX TIME RANGES")
+    test_offset_range_matches_local_range()
+    test_date_prefix_end_covers_the_day()
+    print("✅ Offset-aware ranges handled")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Test that chunking does not change a message's verdict
+A message just under the model window is scored whole and one just over it is
+scored in chunks; with the same model output both must get the same label.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app_hf
+from chunking import CHUNK_MAX_TOKENS, needs_chunking
+
+
+class StubClassifier:
+    """Stands in for the pipeline: every text gets the same top prediction"""
+
+    def __init__(self, label, score):
+        self.prediction = {'label': label, 'score': score}
+
+    def __call__(self, texts):
+        return [dict(self.prediction) for _ in texts]
+
+
+def labels_around_window(label, score):
+    app_hf.classifier = StubClassifier(label, score)
+    app_hf.model_ready.set()
+    under = ' '.join(['word'] * CHUNK_MAX_TOKENS)
+    over = under + ' word'
+    assert not needs_chunking(under) and needs_chunking(over)
+    return [result[0] for result in app_hf.classify_messages([under, over])]
+
+
+def test_same_label_across_window():
+    """Whole and chunked messages share one decision rule"""
+    for label, score in (('toxic', 0.3), ('toxic', 0.9), ('non-toxic', 0.8), ('non-toxic', 0.4)):
+        under, over = labels_around_window(label, score)
+        print(f"{label} {score}: under window {under}, over window {over}")
+        assert under == over
+
+
+if __name__ == "__main__":
+    print("🧪 TESTING LABELS ACROSS THE CHUNKING WINDOW")
+    test_same_label_across_window()
+    print("✅ Same verdict whole and chunked")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Test that blank sender cells in uploaded CSVs are read as missing
+Blank user and timestamp cells must come through as None, not NaN, or
+analyze_file slices a float timestamp and counts "nan" as a sender.
+"""
+
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app_hf import iter_file_batches, analyze_file
+
+BLANK_SENDER_CSV = "timestamp,user,message\n,,hi you idiot\n2026-10-19T09:00,bob,thanks for the help\n"
+
+
+def write_csv(text):
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as f:
+        f.write(text)
+    return f.name
+
+
+def test_blank_cells_are_none():
+    """Blank user and timestamp cells are None in the batches"""
+    path = write_csv(BLANK_SENDER_CSV)
+    try:
+        batches = list(iter_file_batches(path))
+    finally:
+        os.remove(path)
+
+    messages, users, timestamps = batches[0]
+    print(f"users: {users}, timestamps: {timestamps}")
+    assert messages == ['hi you idiot', 'thanks for the help']
+    assert users == [None, 'bob']
+    assert timestamps == [None, '2026-10-19T09:00']
+
+
+def test_analyze_file_with_blank_cells():
+    """A file with blank sender cells is analyzed without counting a "nan" sender"""
+    path = write_csv(BLANK_SENDER_CSV)
+    try:
+        summary, _, export_path = analyze_file(SimpleNamespace(name=path))
+    finally:
+        os.remove(path)
+
+    print(summary)
+    assert not summary.startswith('Error')
+    assert '**nan**' not in summary
+    assert '**bob**: ' in summary
+    if export_path:
+        os.remove(export_path)
+
+
+if __name__ == "__main__":
+    print("🧪 TESTING BLANK SENDER CELLS")
+    test_blank_cells_are_none()
+    test_analyze_file_with_blank_cells()
+    print("✅ Blank cells handled")
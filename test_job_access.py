@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Test that background jobs are only visible to the session that submitted them
+Another session asking for a job's status, results, stream or results page gets
+a 404, as if the job did not exist.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app
+
+
+def submit_job(client):
+    response = client.post('/jobs', data={'text_input': 'thanks for the help\nsee you tomorrow'})
+    assert response.status_code == 202
+    return response.get_json()
+
+
+def test_owner_can_read_job():
+    """The submitting session can follow its own job"""
+    client = app.test_client()
+    job = submit_job(client)
+    for url in (job['status_url'], job['results_url'], job['view_url']):
+        response = client.get(url)
+        print(f"owner {url}: {response.status_code}")
+        assert response.status_code == 200
+    assert 'owner' not in client.get(job['status_url']).get_json()
+
+
+def test_other_session_gets_404():
+    """Another session cannot read the job or take it over for exports"""
+    job = submit_job(app.test_client())
+    other = app.test_client()
+    for url in (job['status_url'], job['results_url'], f"/jobs/{job['job_id']}/stream", job['view_url']):
+        response = other.get(url)
+        print(f"other session {url}: {response.status_code}")
+        assert response.status_code == 404
+    with other.session_transaction() as session:
+        assert 'analysis_id' not in session
+
+
+if __name__ == "__main__":
+    print("🧪 TESTING JOB ACCESS")
+    test_owner_can_read_job()
+    test_other_session_gets_404()
+    print("✅ Jobs are private to their session")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the admin time-series API with timezone-aware ?start= and ?end= values
+Timestamps with a UTC offset are converted to the log's local time instead of
+failing the request.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta, timezone
+
+from app import app
+import rollups
+
+
+def admin_client():
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'admin@company.com'
+        session['user_role'] = 'admin'
+    return client
+
+
+def test_parse_time_with_offset():
+    """An aware timestamp becomes the same instant in naive local time"""
+    parsed = rollups.parse_time('2026-09-01T00:00:00+00:00')
+    print(f"2026-09-01T00:00:00+00:00 -> {parsed}")
+    assert parsed == datetime(2026, 9, 1, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def test_timeseries_with_offsets():
+    """?start= and ?end= with UTC offsets return buckets, not a server error"""
+    client = admin_client()
+    end = datetime.now().astimezone()
+    start = end - timedelta(hours=2)
+    for params in (
+        {'start': start.isoformat(), 'end': end.isoformat()},
+        {'start': start.isoformat()},
+        {'start': start.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'), 'resolution': 'minute'},
+    ):
+        response = client.get('/api/admin/timeseries', query_string=params)
+        print(f"{params} -> {response.status_code}")
+        assert response.status_code == 200
+        assert response.get_json()['buckets']
+
+
+if __name__ == "__main__":
+    print("🧪 TESTING TIME-SERIES API WITH TIMEZONES")
+    test_parse_time_with_offset()
+    test_timeseries_with_offsets()
+    print("✅ Timezone-aware ranges handled")
@@ -10,15 +10,30 @@ Features:
 - Tests each message with the hybrid detection system (rules + Groq API)
 - Provides toxicity scores, confidence levels, and explanations
 - Generates empathetic rewrites for toxic messages
-- Exports results to CSV for analysis
-- Tracks API usage and performance metrics
+- Exports results to CSV for analysis, appending each result as soon as it is ready
+- Checkpoints finished messages so an interrupted run can be resumed with --resume
+- Tests messages concurrently under a shared API rate limit, writing results in order
+- Tracks API usage, per-call latency and performance metrics
+
+Usage:
+    python test_toxicity_batch.py
+    python test_toxicity_batch.py --input corpus.txt --output results.csv
+    python test_toxicity_batch.py --workers 16 --rate 20     # 16 threads, at most 20 API calls/s
+    python test_toxicity_batch.py --resume                  # continue the latest run
+    python test_toxicity_batch.py --resume --output results.csv
 """
 
 import os
 import csv
+import glob
 import json
 import time
 import re
+import hashlib
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
 # Load environment variables
@@ -40,6 +55,61 @@ import requests
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY', '')
 TEST_FILE = 'test_messages_new.txt'
 OUTPUT_CSV = f'toxicity_test_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+# Concurrent API calls and the shared request budget they draw from (0 = unlimited)
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '8'))
+GROQ_RATE_LIMIT = float(os.environ.get('GROQ_RATE_LIMIT', '10'))
+
+# CSV columns, shared by the incremental writer and the resume/summary readers
+CSV_FIELDNAMES = [
+    'message_id', 'message', 'message_length',
+    'final_is_toxic', 'final_confidence', 'final_source',
+    'rule_is_toxic', 'rule_confidence', 'rule_reason',
+    'groq_is_toxic', 'groq_confidence', 'groq_reason', 'groq_tokens',
+    'empathy_rewrite', 'rewrite_tokens', 'rewrite_failed',
+    'rule_latency_ms', 'groq_latency_ms', 'rewrite_latency_ms',
+    'processing_time_seconds'
+]
+BOOL_FIELDS = ['final_is_toxic', 'rule_is_toxic', 'groq_is_toxic', 'rewrite_failed']
+FLOAT_FIELDS = ['final_confidence', 'rule_confidence', 'groq_confidence',
+                'rule_latency_ms', 'groq_latency_ms', 'rewrite_latency_ms', 'processing_time_seconds']
+INT_FIELDS = ['message_id', 'message_length', 'groq_tokens', 'rewrite_tokens']
+
+class RateLimiter:
+    """Token bucket shared by all worker threads, so concurrency never exceeds the API budget"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+RATE_LIMITER = RateLimiter(GROQ_RATE_LIMIT)
+
+def timed_groq_call(text, task):
+    """Call the Groq API under the shared rate limit, returning (result, latency in ms)
+
+    The latency covers the API call only, not the time spent waiting for the limiter.
+    """
+    RATE_LIMITER.acquire()
+    call_start = time.perf_counter()
+    result = call_groq_api(text, task)
+    return result, round((time.perf_counter() - call_start) * 1000, 1)
 
 def call_groq_api(text, task="toxicity"):
     """Call Groq API for ultra-fast toxicity detection or rewriting"""
@@ -135,11 +205,12 @@ Respond with ONLY the rewritten message, nothing else."""
                 rewritten = result['choices'][0]['message']['content'].strip()
                 rewritten = rewritten.strip('"').strip()
                 
-                if len(rewritten) > 5 and rewritten.lower() != text.lower():
-                    return {
-                        'rewrite': rewritten,
-                        'tokens_used': result.get('usage', {}).get('total_tokens', 0)
-                    }
+                # A too-short or unchanged rewrite is a valid answer with nothing to suggest
+                usable = len(rewritten) > 5 and rewritten.lower() != text.lower()
+                return {
+                    'rewrite': rewritten if usable else '',
+                    'tokens_used': result.get('usage', {}).get('total_tokens', 0)
+                }
                     
     except Exception as e:
         print(f"🔴 Groq API error: {e}")
@@ -203,11 +274,12 @@ def classify_with_rules(text):
         'source': 'rules'
     }
 
-def test_single_message(message, message_id):
+def test_single_message(message, message_id, verbose=True):
     """Test a single message with both rule-based and API detection"""
     
-    print(f"\n🧪 Testing Message {message_id}")
-    print(f"📝 Text: '{message[:60]}...' " if len(message) > 60 else f"📝 Text: '{message}'")
+    if verbose:
+        print(f"\n🧪 Testing Message {message_id}")
+        print(f"📝 Text: '{message[:60]}...' " if len(message) > 60 else f"📝 Text: '{message}'")
     
     results = {
         'message_id': message_id,
@@ -218,16 +290,18 @@ def test_single_message(message, message_id):
     start_time = time.time()
     
     # Test with rule-based detection
+    rule_start = time.perf_counter()
     rule_result = classify_with_rules(message)
     results.update({
         'rule_is_toxic': rule_result['is_toxic'],
         'rule_confidence': rule_result['confidence'],
-        'rule_reason': rule_result['reason']
+        'rule_reason': rule_result['reason'],
+        'rule_latency_ms': round((time.perf_counter() - rule_start) * 1000, 3)
     })
     
     # Test with Groq API
     if GROQ_API_KEY:
-        api_result = call_groq_api(message, "toxicity")
+        api_result, results['groq_latency_ms'] = timed_groq_call(message, "toxicity")
         if api_result:
             results.update({
                 'groq_is_toxic': api_result['is_toxic'],
@@ -238,7 +312,8 @@ def test_single_message(message, message_id):
             
             # Generate rewrite if toxic
             if api_result['is_toxic']:
-                rewrite_result = call_groq_api(message, "rewrite")
+                rewrite_result, results['rewrite_latency_ms'] = timed_groq_call(message, "rewrite")
+                results['rewrite_failed'] = rewrite_result is None
                 if rewrite_result:
                     results.update({
                         'empathy_rewrite': rewrite_result['rewrite'],
@@ -273,19 +348,20 @@ def test_single_message(message, message_id):
         results['final_source'] = 'rules'
     
     # Print summary
-    final_label = "🔴 TOXIC" if results['final_is_toxic'] else "✅ SAFE"
-    confidence = results['final_confidence']
-    print(f"   Result: {final_label} ({confidence:.1%} confidence)")
-    print(f"   Time: {results['processing_time_seconds']}s")
+    if verbose:
+        final_label = "🔴 TOXIC" if results['final_is_toxic'] else "✅ SAFE"
+        confidence = results['final_confidence']
+        print(f"   Result: {final_label} ({confidence:.1%} confidence)")
+        print(f"   Time: {results['processing_time_seconds']}s")
     
     return results
 
-def load_test_messages():
+def load_test_messages(test_file=TEST_FILE):
     """Load test messages from file"""
     messages = []
     
     try:
-        with open(TEST_FILE, 'r', encoding='utf-8') as f:
+        with open(test_file, 'r', encoding='utf-8') as f:
             for line in f:
                 line = line.strip()
                 if line and not line.startswith('#'):  # Skip empty lines and comments
@@ -294,53 +370,188 @@ def load_test_messages():
                     if message:
                         messages.append(message)
         
-        print(f"📁 Loaded {len(messages)} test messages from {TEST_FILE}")
+        print(f"📁 Loaded {len(messages)} test messages from {test_file}")
         return messages
         
     except FileNotFoundError:
-        print(f"❌ File {TEST_FILE} not found!")
+        print(f"❌ File {test_file} not found!")
         return []
     except Exception as e:
         print(f"❌ Error loading file: {e}")
         return []
 
-def save_results_to_csv(results):
+def message_fingerprint(message):
+    """Short hash recorded in the checkpoint so --resume notices a changed input file"""
+    return hashlib.sha1(message.encode('utf-8')).hexdigest()[:12]
+
+def checkpoint_path(output_csv):
+    return output_csv + '.checkpoint'
+
+def summary_path(output_csv):
+    return os.path.splitext(output_csv)[0] + '_summary.json'
+
+def is_complete(result):
+    """Whether a result has every API answer it needs, so a resumed run can skip it"""
+    if result.get('groq_reason') == "API call failed":
+        return False
+    # A toxic verdict whose rewrite call failed is retried as well; an empty rewrite is an answer
+    if result.get('rewrite_failed') is None:
+        # Rows from before rewrite_failed was recorded: only a rewrite tells them apart
+        return not (result.get('groq_is_toxic') and not result.get('empathy_rewrite'))
+    return not result['rewrite_failed']
+
+def write_atomically(path, write):
+    """Write a file through a temporary file so readers never see it half-written"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_result_rows(output_csv):
+    """Raw CSV rows of a results file, tolerating a half-written last line"""
+    rows = []
+    if not os.path.exists(output_csv):
+        return rows
+    with open(output_csv, 'r', newline='', encoding='utf-8') as f:
+        try:
+            for row in csv.DictReader(f):
+                rows.append(row)
+        except csv.Error as e:
+            print(f"⚠️ Ignoring unreadable tail of {output_csv}: {e}")
+    return rows
+
+def parse_result_row(row):
+    """Convert a CSV row back into the typed result dict test_single_message returns"""
+    result = dict(row)
+    for field in BOOL_FIELDS:
+        result[field] = {'True': True, 'False': False}.get(row.get(field))
+    for field in FLOAT_FIELDS:
+        result[field] = float(row[field]) if row.get(field) else None
+    for field in INT_FIELDS:
+        result[field] = int(row[field]) if (row.get(field) or '').isdigit() else 0
+    return result
+
+def write_result_rows(output_csv, rows):
+    """Atomically replace a results CSV with the given rows"""
+    def write(f):
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    write_atomically(output_csv, write)
+
+def load_checkpoint(output_csv):
+    """Finished message ids of a previous run, mapped to their message fingerprints"""
+    finished = {}
+    path = checkpoint_path(output_csv)
+    if not os.path.exists(path):
+        return finished
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            # A line cut short by a crash is simply ignored
+            if len(parts) == 2 and parts[0].isdigit():
+                finished[int(parts[0])] = parts[1]
+    return finished
+
+def recover_output(output_csv, messages):
+    """Prepare a previous run's output for resuming and return the finished message ids
+
+    Only rows recorded in the checkpoint are kept; rows written after the last
+    checkpoint entry (a crash mid-write, or results that still need an API
+    answer) are dropped so those messages are tested again.
+    """
+    finished = load_checkpoint(output_csv)
+    kept = {}
+    for row in read_result_rows(output_csv):
+        message_id = int(row['message_id']) if (row.get('message_id') or '').isdigit() else None
+        if message_id is None or message_id in kept or message_id > len(messages):
+            continue
+        fingerprint = message_fingerprint(messages[message_id - 1])
+        if finished.get(message_id) == fingerprint and row.get('message') == messages[message_id - 1]:
+            kept[message_id] = row
+
+    changed = sum(1 for message_id, fingerprint in finished.items()
+                  if message_id not in kept and message_id <= len(messages)
+                  and fingerprint != message_fingerprint(messages[message_id - 1]))
+    if changed:
+        print(f"⚠️ {changed} checkpointed messages no longer match the input file and will be re-tested")
+
+    rows = [kept[message_id] for message_id in sorted(kept)]
+    write_result_rows(output_csv, rows)
+    write_atomically(checkpoint_path(output_csv), lambda f: f.writelines(
+        f"{message_id}\t{message_fingerprint(messages[message_id - 1])}\n" for message_id in sorted(kept)
+    ))
+    return set(kept)
+
+class CheckpointedResults:
+    """Append-as-you-go CSV output with a checkpoint of finished message ids
+
+    Every row is flushed to disk before its id is checkpointed, so after a crash
+    the checkpoint never names a result that was not saved.
+    """
+
+    def __init__(self, output_csv):
+        new_file = not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0
+        self.csv_file = open(output_csv, 'a', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.csv_file, fieldnames=CSV_FIELDNAMES, extrasaction='ignore')
+        if new_file:
+            self.writer.writeheader()
+        self.checkpoint = open(checkpoint_path(output_csv), 'a', encoding='utf-8')
+        self.written = 0
+
+    def write(self, result):
+        """Append one result, checkpointing it when nothing needs to be retried"""
+        self.writer.writerow({field: result.get(field, '') for field in CSV_FIELDNAMES})
+        self.csv_file.flush()
+        os.fsync(self.csv_file.fileno())
+        self.written += 1
+        if is_complete(result):
+            self.checkpoint.write(f"{result['message_id']}\t{message_fingerprint(result['message'])}\n")
+            self.checkpoint.flush()
+            os.fsync(self.checkpoint.fileno())
+
+    def close(self):
+        self.csv_file.close()
+        self.checkpoint.close()
+
+def save_results_to_csv(results, output_csv=OUTPUT_CSV):
     """Save test results to CSV file"""
     
     if not results:
         print("❌ No results to save")
         return
     
-    # Define CSV columns
-    fieldnames = [
-        'message_id', 'message', 'message_length',
-        'final_is_toxic', 'final_confidence', 'final_source',
-        'rule_is_toxic', 'rule_confidence', 'rule_reason',
-        'groq_is_toxic', 'groq_confidence', 'groq_reason', 'groq_tokens',
-        'empathy_rewrite', 'rewrite_tokens',
-        'processing_time_seconds'
-    ]
-    
     try:
-        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for result in results:
-                # Ensure all fields exist
-                row = {}
-                for field in fieldnames:
-                    row[field] = result.get(field, '')
-                writer.writerow(row)
-        
-        print(f"✅ Results saved to {OUTPUT_CSV}")
-        return OUTPUT_CSV
+        write_result_rows(output_csv, [{field: result.get(field, '') for field in CSV_FIELDNAMES} for result in results])
+        print(f"✅ Results saved to {output_csv}")
+        return output_csv
         
     except Exception as e:
         print(f"❌ Error saving CSV: {e}")
         return None
 
-def generate_summary_report(results):
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def latency_stats(results, field):
+    """p50/p95/max of a per-call latency column, skipping calls that were not made"""
+    values = [r[field] for r in results if r.get(field) is not None]
+    if not values:
+        return None
+    return {
+        'calls': len(values),
+        'p50_ms': percentile(values, 0.5),
+        'p95_ms': percentile(values, 0.95),
+        'max_ms': max(values)
+    }
+
+def generate_summary_report(results, output_csv=OUTPUT_CSV, wall_seconds=None, tested=None):
     """Generate summary statistics"""
     
     if not results:
@@ -355,12 +566,14 @@ def generate_summary_report(results):
     # Calculate accuracy metrics
     rule_toxic = sum(1 for r in results if r.get('rule_is_toxic'))
     groq_toxic = sum(1 for r in results if r.get('groq_is_toxic'))
+    incomplete = sum(1 for r in results if not is_complete(r))
     
     # Performance metrics
-    total_time = sum(r.get('processing_time_seconds', 0) for r in results)
+    total_time = sum(r.get('processing_time_seconds') or 0 for r in results)
     avg_time = total_time / total_messages if total_messages > 0 else 0
     
-    total_tokens = sum(r.get('groq_tokens', 0) + r.get('rewrite_tokens', 0) for r in results)
+    total_tokens = sum((r.get('groq_tokens') or 0) + (r.get('rewrite_tokens') or 0) for r in results)
+    latencies = {step: latency_stats(results, f'{step}_latency_ms') for step in ('rule', 'groq', 'rewrite')}
     
     print("\n" + "="*60)
     print("📊 TEST SUMMARY REPORT")
@@ -368,6 +581,8 @@ def generate_summary_report(results):
     print(f"📝 Total Messages Tested: {total_messages}")
     print(f"🔴 Classified as TOXIC: {toxic_count} ({toxic_count/total_messages*100:.1f}%)")
     print(f"✅ Classified as SAFE: {safe_count} ({safe_count/total_messages*100:.1f}%)")
+    if incomplete:
+        print(f"⚠️ Missing an API answer: {incomplete} (re-run with --resume to retry)")
     print()
     print("🔍 Detection Method Comparison:")
     print(f"   Rules detected toxic: {rule_toxic} ({rule_toxic/total_messages*100:.1f}%)")
@@ -378,56 +593,164 @@ def generate_summary_report(results):
     print(f"   Average time per message: {avg_time:.2f} seconds")
     print(f"   Total API tokens used: {total_tokens}")
     print(f"   Average tokens per message: {total_tokens/total_messages:.1f}")
+    if wall_seconds and tested:
+        print(f"   This run: {tested} messages in {wall_seconds:.1f}s ({tested / wall_seconds:.1f} messages/s)")
+    for step, stats in latencies.items():
+        if stats:
+            print(f"   {step.capitalize()} latency: p50 {stats['p50_ms']:.1f}ms, p95 {stats['p95_ms']:.1f}ms"
+                  f" ({stats['calls']} calls)")
     print()
-    print(f"💾 Detailed results saved to: {OUTPUT_CSV}")
+    print(f"💾 Detailed results saved to: {output_csv}")
     print("="*60)
+    
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'results_file': output_csv,
+        'total_messages': total_messages,
+        'toxic_messages': toxic_count,
+        'safe_messages': safe_count,
+        'incomplete_messages': incomplete,
+        'rule_toxic': rule_toxic,
+        'groq_toxic': groq_toxic,
+        'total_processing_seconds': round(total_time, 2),
+        'average_seconds_per_message': round(avg_time, 3),
+        'total_tokens': total_tokens,
+        'latency': latencies,
+        'run_wall_seconds': round(wall_seconds, 2) if wall_seconds else None,
+        'run_messages': tested
+    }
+
+def run_tests(pending, output, workers):
+    """Test messages on a thread pool, writing each result in message order
+
+    Results that finish early wait in a small reorder buffer until every earlier
+    message is written; the number of messages in flight or buffered is capped
+    so memory stays flat on large corpora.
+    """
+    verbose = workers == 1
+    window = workers * 4
+    queue = iter(pending)
+    expected = deque()
+    in_flight = {}
+    buffered = {}
+    start = time.time()
+    
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            while len(in_flight) + len(buffered) < window:
+                item = next(queue, None)
+                if item is None:
+                    break
+                message_id, message = item
+                expected.append(message_id)
+                in_flight[executor.submit(test_single_message, message, message_id, verbose)] = message_id
+            if not in_flight:
+                break
+            
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                message_id = in_flight.pop(future)
+                try:
+                    buffered[message_id] = future.result()
+                except Exception as e:
+                    # Left out of the checkpoint, so --resume tests it again
+                    print(f"❌ Error testing message {message_id}: {e}")
+                    buffered[message_id] = None
+            
+            while expected and expected[0] in buffered:
+                result = buffered.pop(expected.popleft())
+                if result:
+                    output.write(result)
+                    if not verbose and output.written % 50 == 0:
+                        elapsed = time.time() - start
+                        print(f"   ⏱️ {output.written}/{len(pending)} tested ({output.written / elapsed:.1f} messages/s)")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def latest_checkpointed_output():
+    """Most recent results CSV that has a checkpoint next to it"""
+    candidates = [path for path in glob.glob('toxicity_test_results_*.csv') if os.path.exists(checkpoint_path(path))]
+    return max(candidates, key=os.path.getmtime) if candidates else None
 
 def main():
     """Main testing function"""
     
+    parser = argparse.ArgumentParser(description="Batch-test messages with rule-based and Groq detection")
+    parser.add_argument('--input', default=TEST_FILE, help="Messages to test, one per line")
+    parser.add_argument('--output', help="Results CSV (default: a new timestamped file)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run, skipping messages it already finished")
+    parser.add_argument('--workers', type=int, default=BATCH_WORKERS, help="Messages tested concurrently")
+    parser.add_argument('--rate', type=float, default=GROQ_RATE_LIMIT,
+                        help="Maximum Groq API calls per second across all workers (0 = unlimited)")
+    args = parser.parse_args()
+    
+    global RATE_LIMITER
+    RATE_LIMITER = RateLimiter(args.rate)
+    
+    output_csv = args.output
+    if args.resume and not output_csv:
+        output_csv = latest_checkpointed_output()
+        if not output_csv:
+            print("❌ No checkpointed run found to resume - pass --output")
+            return
+    output_csv = output_csv or OUTPUT_CSV
+    
+    if not args.resume and os.path.exists(output_csv):
+        print(f"❌ {output_csv} already exists - use --resume to continue it")
+        return
+    
     print("🚀 SafeSpace.AI - Comprehensive Toxicity Testing")
     print("=" * 60)
     print(f"📅 Test Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"🔑 Groq API: {'✅ Available' if GROQ_API_KEY else '❌ Not configured'}")
-    print(f"📁 Test File: {TEST_FILE}")
-    print(f"📊 Output File: {OUTPUT_CSV}")
+    print(f"📁 Test File: {args.input}")
+    print(f"📊 Output File: {output_csv}")
+    print(f"⚙️ Workers: {args.workers}, rate limit: {f'{args.rate:g} calls/s' if args.rate > 0 else 'none'}")
     print()
     
     # Load test messages
-    messages = load_test_messages()
+    messages = load_test_messages(args.input)
     if not messages:
         print("❌ No messages to test!")
         return
     
-    print(f"🧪 Starting test of {len(messages)} messages...")
-    print("⏱️  This may take several minutes with API calls...")
+    finished = recover_output(output_csv, messages) if args.resume else set()
+    pending = [(i, message) for i, message in enumerate(messages, 1) if i not in finished]
+    if args.resume:
+        print(f"🔁 Resuming: {len(finished)} messages already done, {len(pending)} remaining")
     
-    # Test each message
-    results = []
-    
-    for i, message in enumerate(messages, 1):
-        try:
-            result = test_single_message(message, i)
-            results.append(result)
-            
-            # Small delay to avoid rate limiting
-            time.sleep(0.5)
-            
-        except KeyboardInterrupt:
-            print("\n⚠️ Testing interrupted by user")
-            break
-        except Exception as e:
-            print(f"❌ Error testing message {i}: {e}")
-            continue
+    print(f"🧪 Starting test of {len(pending)} messages...")
+    print("⏱️  This may take several minutes with API calls...")
     
-    print(f"\n✅ Testing completed! Processed {len(results)} messages")
+    # Each result is appended and checkpointed as soon as it and every earlier one is ready
+    output = CheckpointedResults(output_csv)
+    run_start = time.time()
     
-    # Save results
-    if results:
-        save_results_to_csv(results)
-        generate_summary_report(results)
+    try:
+        run_tests(pending, output, max(1, args.workers))
+    except KeyboardInterrupt:
+        print("\n⚠️ Testing interrupted by user")
+        print(f"   Finished results are saved - continue with: --resume --output {output_csv}")
+    finally:
+        output.close()
+    wall_seconds = time.time() - run_start
+    tested = output.written
+    
+    print(f"\n✅ Testing completed! Processed {tested} messages")
+    
+    # Summarise the whole file, including results from earlier runs of a resumed test
+    rows = read_result_rows(output_csv)
+    rows.sort(key=lambda row: int(row['message_id']) if (row.get('message_id') or '').isdigit() else 0)
+    write_result_rows(output_csv, rows)
+    
+    summary = generate_summary_report([parse_result_row(row) for row in rows], output_csv, wall_seconds, tested)
+    if summary:
+        write_atomically(summary_path(output_csv), lambda f: json.dump(summary, f, indent=2))
+        print(f"📄 Summary saved to {summary_path(output_csv)}")
     
     print("\n🎉 Testing complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Toxicity model loading for SafeSpace.AI
+Builds the toxic-bert classifier for the configured backend. Shared by the
+Gradio app (app_hf.py) and the inference pool workers (inference_pool.py).
+Spawned workers still re-run app_hf.py's top level as __mp_main__, so gradio
+is imported inside create_interface(), which only runs under its __main__ guard.
+"""
+
+import os
+
+# Inference backend: "pytorch" (transformers pipeline) or "onnx" (see export_onnx.py)
+SAFESPACE_BACKEND = os.environ.get('SAFESPACE_BACKEND', 'pytorch').lower()
+
+# Representative inputs used to warm up kernels and tokenizer caches before serving
+WARMUP_MESSAGES = [
+    "Hello team, great work today!",
+    "You're an idiot and I hate working with you.",
+    "Can you send me the status report before the meeting tomorrow?",
+    "This is stupid and a waste of time, but thanks for trying.",
+    "I appreciate everyone's hard work on this project. Looking forward to the next sprint and to "
+    "seeing how the new process improves our delivery times across all of the teams involved."
+]
+
+
+def load_model(threads=None):
+    """Build the toxicity classifier for the configured backend
+
+    threads limits the CPU threads used by this model instance; pool workers
+    pass their share of the cores so workers do not oversubscribe the host.
+    """
+    if SAFESPACE_BACKEND == 'onnx':
+        from onnx_backend import ONNXToxicityClassifier
+        model = ONNXToxicityClassifier(intra_op_threads=threads)
+        print(f"⚡ Using ONNX Runtime backend: {model.model_path}")
+        return model
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    from transformers import pipeline
+    return pipeline(
+        "text-classification",
+        model="unitary/toxic-bert",
+        tokenizer="unitary/toxic-bert"
+    )
+
+
+def warm_up_model(model):
+    """Run representative inputs through the model so the first user request is not the slow one"""
+    for message in WARMUP_MESSAGES:
+        model(message)
+    # Also exercise the batched path used for bulk analysis
+    model(WARMUP_MESSAGES)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Upstream call scheduler for SafeSpace.AI
+Every Groq API call passes through one shared scheduler, so the realtime typing
+box, bulk uploads and background backfills draw from the same quota without a
+big upload starving the interactive UI.
+
+Each call names a priority class. Free slots go to the class with the lowest
+weighted-fair-queueing tag, except that an interactive call waiting longer than
+its latency target jumps the queue, and a few slots are held back for
+interactive calls so they never wait behind a full pipe of bulk work.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+BACKFILL = 'backfill'
+
+# Share of the upstream each class gets while all of them are waiting
+PRIORITY_WEIGHTS = {INTERACTIVE: 8, BULK: 2, BACKFILL: 1}
+
+UPSTREAM_CONCURRENCY = int(os.environ.get('UPSTREAM_CONCURRENCY', '8'))
+# Calls per second across all classes (0 = no rate limit, only the concurrency cap)
+UPSTREAM_RATE_LIMIT = float(os.environ.get('UPSTREAM_RATE_LIMIT', '0'))
+# Slots bulk and backfill calls may never occupy
+INTERACTIVE_RESERVED_SLOTS = int(os.environ.get('INTERACTIVE_RESERVED_SLOTS', '1'))
+# Interactive calls queued longer than this are dispatched ahead of every other class
+INTERACTIVE_TARGET_MS = float(os.environ.get('INTERACTIVE_TARGET_MS', '250'))
+# Recent queue waits kept per class for the stats endpoint
+WAIT_SAMPLES = 1000
+
+
+class UpstreamScheduler:
+    """Priority-aware admission control for calls to the upstream API"""
+
+    def __init__(self, concurrency=UPSTREAM_CONCURRENCY, rate=UPSTREAM_RATE_LIMIT,
+                 weights=PRIORITY_WEIGHTS, reserved=INTERACTIVE_RESERVED_SLOTS,
+                 target_ms=INTERACTIVE_TARGET_MS):
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.weights = dict(weights)
+        self.reserved = min(reserved, self.concurrency - 1)
+        self.target = target_ms / 1000
+
+        self._cond = threading.Condition()
+        self._queues = {name: deque() for name in self.weights}
+        self._in_flight = {name: 0 for name in self.weights}
+        self._finish_tags = {name: 0.0 for name in self.weights}
+        self._virtual_time = 0.0
+        self._tokens = max(1.0, rate)
+        self._refilled = time.monotonic()
+        self._waits = {name: deque(maxlen=WAIT_SAMPLES) for name in self.weights}
+        self._served = {name: 0 for name in self.weights}
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        """Hold an upstream slot for the duration of one API call"""
+        priority = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def acquire(self, priority=INTERACTIVE):
+        """Block until the scheduler hands this call a slot, returning its priority class"""
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        ticket = object()
+        enqueued = time.monotonic()
+        with self._cond:
+            self._queues[priority].append((ticket, enqueued))
+            while True:
+                timeout = self._refill()
+                chosen = self._pick() if timeout is None else None
+                if chosen == priority and self._queues[priority][0][0] is ticket:
+                    self._start(priority)
+                    self._waits[priority].append(time.monotonic() - enqueued)
+                    # Another waiter may be eligible for a remaining slot
+                    self._cond.notify_all()
+                    return priority
+                self._cond.wait(timeout if timeout is not None else self.target or None)
+
+    def release(self, priority):
+        """Return a slot after the call finished"""
+        with self._cond:
+            self._in_flight[priority] -= 1
+            self._cond.notify_all()
+
+    def _refill(self):
+        """Top up the rate-limit bucket; returns seconds until a token is free, or None"""
+        if self.rate <= 0:
+            return None
+        now = time.monotonic()
+        self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            return None
+        return (1 - self._tokens) / self.rate
+
+    def _can_start(self, priority):
+        busy = sum(self._in_flight.values())
+        if busy >= self.concurrency:
+            return False
+        if priority == INTERACTIVE:
+            return True
+        background = busy - self._in_flight.get(INTERACTIVE, 0)
+        return background < self.concurrency - self.reserved
+
+    def _tag(self, priority):
+        """Start-time fair queueing: the virtual finish time of this class's next call"""
+        return max(self._virtual_time, self._finish_tags[priority]) + 1.0 / self.weights[priority]
+
+    def _pick(self):
+        """The class whose oldest waiter should get the next free slot"""
+        eligible = [name for name, queue in self._queues.items() if queue and self._can_start(name)]
+        if not eligible:
+            return None
+
+        # Interactive calls past their latency target skip the fair-share order
+        interactive = self._queues.get(INTERACTIVE)
+        if INTERACTIVE in eligible and time.monotonic() - interactive[0][1] >= self.target:
+            return INTERACTIVE
+        return min(eligible, key=self._tag)
+
+    def _start(self, priority):
+        self._queues[priority].popleft()
+        tag = self._tag(priority)
+        self._finish_tags[priority] = tag
+        self._virtual_time = tag - 1.0 / self.weights[priority]
+        self._in_flight[priority] += 1
+        self._served[priority] += 1
+        if self.rate > 0:
+            self._tokens -= 1
+
+    def stats(self):
+        """Queue depth, in-flight calls and recent queue-wait percentiles per class"""
+        with self._cond:
+            stats = {}
+            for name in self.weights:
+                waits = sorted(self._waits[name])
+                stats[name] = {
+                    'queued': len(self._queues[name]),
+                    'in_flight': self._in_flight[name],
+                    'served': self._served[name],
+                    'wait_p50_ms': round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    'wait_p95_ms': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else None
+                }
+            return {
+                'concurrency': self.concurrency,
+                'rate_limit': self.rate,
+                'interactive_reserved_slots': self.reserved,
+                'interactive_target_ms': self.target * 1000,
+                'classes': stats
+            }